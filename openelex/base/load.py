@@ -1,12 +1,335 @@
-from os.path import dirname, exists, join
+from collections import namedtuple
+from contextlib import contextmanager
+from multiprocessing import Pool
+from os.path import dirname, exists, getsize, join
 from os import listdir
+import datetime
+import hashlib
 import inspect
 import json
+import re
+import resource
+import time
+import traceback
 
-import csv
 import unicodecsv
+from mongoengine.base.common import _document_registry
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from mongoengine.connection import disconnect
+from mongoengine.errors import ValidationError
+from mongoengine.context_managers import switch_collection
+from mongoengine.fields import ReferenceField
 
+from openelex.lib.text import slugify
+from openelex.models import Candidate, Contest, LoadLedger, Result
+from .cache import StateCache
+from .partition import BASE_NAME, is_partitioned
 from .state import StateBase
+from .tabular import tabular_file_rows
+
+
+class BulkInserter(object):
+    """
+    Buffers documents and inserts them in fixed-size batches.
+
+    Documents are passed in as dicts of field values, the same kwargs
+    you'd use to build a mongoengine Document, and are converted straight
+    to raw Mongo documents (db field names, referenced documents replaced
+    by their ids) rather than going through Document instances. Every
+    validate_every-th document is also built as a full Document and
+    validated, so a loader that drifts from the schema fails fast without
+    paying for validation on every row.
+
+    Inserts go directly through pymongo, are unordered (continue_on_error)
+    and inserted documents are not re-fetched, so at most batch_size
+    documents are held in memory at any time, regardless of the size
+    of the source file.
+
+    before_flush, if provided, is called before each batch is written and
+    can return a dict of ids to replace in the batch's references. With
+    stamp_updated, each batch has its updated field set to the time it's
+    written, which incremental transforms rely on to find new documents.
+
+    USAGE
+
+        inserter = BulkInserter(Result, batch_size=5000)
+        for row in reader:
+            inserter.add(kwargs)
+        inserter.flush()
+
+    """
+
+    def __init__(self, doc_klass, batch_size=5000, validate_every=1000,
+                 stats=None, before_flush=None, stamp_updated=False):
+        self.doc_klass = doc_klass
+        self.stats = stats
+        self.before_flush = before_flush
+        self.stamp_updated = stamp_updated
+        self.batch_size = batch_size
+        self.validate_every = validate_every
+        self.buffer = []
+        self.count = 0
+        self._seen = 0
+        self._db_fields = dict((name, field.db_field)
+            for name, field in doc_klass._fields.items())
+        self._ref_fields = set(name for name, field in doc_klass._fields.items()
+            if isinstance(field, ReferenceField))
+        self._ref_db_fields = [self._db_fields[name] for name in self._ref_fields]
+
+    def add(self, kwargs):
+        if self.validate_every and self._seen % self.validate_every == 0:
+            self.doc_klass(**kwargs).validate()
+        self._seen += 1
+        self.buffer.append(self.to_mongo(kwargs))
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def extend(self, kwargs_list):
+        for kwargs in kwargs_list:
+            self.add(kwargs)
+
+    def to_mongo(self, kwargs):
+        """Convert a dict of field values to a raw document
+
+        Raises a ValidationError for fields that aren't declared, unless
+        doc_klass is a DynamicDocument.
+        """
+        doc = {}
+        for name, val in kwargs.iteritems():
+            if val is None:
+                continue
+            if name in self._ref_fields:
+                val = getattr(val, 'pk', val)
+            try:
+                doc[self._db_fields[name]] = val
+            except KeyError:
+                if not self.doc_klass._dynamic:
+                    raise ValidationError("%s has no field '%s'" %
+                        (self.doc_klass.__name__, name))
+                doc[name] = val
+        return doc
+
+    def flush(self):
+        if self.before_flush:
+            self.remap(self.before_flush())
+        if not self.buffer:
+            return
+        if self.stamp_updated:
+            field = self._db_fields['updated']
+            now = datetime.datetime.now()
+            for doc in self.buffer:
+                doc[field] = now
+        if self.stats:
+            with self.stats.stage('write'):
+                self.write(self.buffer)
+        else:
+            self.write(self.buffer)
+        self.count += len(self.buffer)
+        self.buffer = []
+
+    def write(self, docs):
+        self.doc_klass._get_collection().insert(docs, continue_on_error=True)
+
+    def remap(self, ids):
+        "Replace referenced ids in buffered documents using a dict of ids"
+        if not ids:
+            return
+        for doc in self.buffer:
+            for field in self._ref_db_fields:
+                if doc.get(field) in ids:
+                    doc[field] = ids[doc[field]]
+
+
+class MemorySink(BulkInserter):
+    """
+    BulkInserter that never writes to Mongo, for dry runs.
+
+    Documents are still built and sampled for validation, then counted
+    and discarded a batch at a time.
+
+    """
+
+    def write(self, docs):
+        pass
+
+
+def peak_rss():
+    "Peak resident memory of this process so far, in MB"
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+class LoadStats(object):
+    """
+    Throughput and per-stage timing for loading a file.
+
+    Time spent reading rows from the source file and writing batches is
+    measured directly; everything else, i.e. converting rows to
+    documents, is reported as transform time.
+
+    Memory is reported as the process's peak RSS, which is a high-water
+    mark over the process's whole lifetime, along with how much the peak
+    rose while loading this file. Files loaded after a bigger one in the
+    same process report no rise.
+
+    USAGE
+
+        loader.stats = LoadStats(mapping['generated_filename'])
+        loader.run(mapping)
+        print(loader.stats.report())
+
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.rows = 0
+        self.stages = {'read': 0.0, 'write': 0.0}
+        self.start = time.time()
+        self.start_peak_rss = peak_rss()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            elapsed = time.time() - start
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed
+
+    def timed_rows(self, rows):
+        "Wrap an iterable of source rows, counting them and timing reads"
+        rows = iter(rows)
+        while True:
+            start = time.time()
+            try:
+                row = next(rows)
+            except StopIteration:
+                self.stages['read'] += time.time() - start
+                return
+            self.stages['read'] += time.time() - start
+            self.rows += 1
+            yield row
+
+    def report(self):
+        elapsed = time.time() - self.start
+        transform = elapsed - sum(self.stages.values())
+        peak = peak_rss()
+        stages = ", ".join("%s %.2fs" % (name, secs) for name, secs in
+            sorted(self.stages.items()) + [('transform', transform)])
+        return ("%s: %s rows in %.2fs (%d rows/sec), process peak RSS "
+            "%.1f MB (+%.1f MB during file); %s" % (self.source, self.rows,
+            elapsed, self.rows / elapsed if elapsed else 0, peak,
+            peak - self.start_peak_rss, stages))
+
+
+ElectionContextBase = namedtuple('ElectionContextBase', [
+    'election_id',
+    'source',
+    'state',
+    'timestamp',
+    'start_date',
+    'end_date',
+    'election_type',
+    'result_type',
+    'special',
+    'primary',
+    'target_offices',
+])
+
+
+class ElectionContext(ElectionContextBase):
+    """Election metadata shared by every row of a results file
+
+    Built once per file so that row processing doesn't repeatedly look up
+    election metadata or parse dates. Slugs are memoized, since the same
+    offices and candidates repeat on many rows of a file.
+
+    """
+
+    @classmethod
+    def build(cls, election_id, source, state, elec_meta,
+              target_offices=None, timestamp=None):
+        return cls(
+            election_id=election_id,
+            source=source,
+            state=state.upper(),
+            timestamp=timestamp or datetime.datetime.now(),
+            start_date=datetime.datetime.strptime(elec_meta['start_date'], "%Y-%m-%d"),
+            end_date=datetime.datetime.strptime(elec_meta['end_date'], "%Y-%m-%d"),
+            election_type=elec_meta['race_type'],
+            result_type=elec_meta['result_type'],
+            special=elec_meta['special'],
+            primary='primary' in election_id,
+            target_offices=target_offices,
+        )
+
+    def __new__(cls, *args, **kwargs):
+        ctx = super(ElectionContext, cls).__new__(cls, *args, **kwargs)
+        ctx._contest_slugs = {}
+        ctx._candidate_slugs = {}
+        return ctx
+
+    def contest_slug(self, office, district, party):
+        """Slug for an office, plus district and party if relevant
+
+        Office and district should already be stripped.
+        """
+        key = (office, district, party)
+        try:
+            return self._contest_slugs[key]
+        except KeyError:
+            bits = [office]
+            if district and 'pres' not in office.lower():
+                bits.append(district)
+            if self.primary and party:
+                bits.append(party.lower())
+            slug = slugify(" ".join(bits), substitute='-')
+            self._contest_slugs[key] = slug
+            return slug
+
+    def candidate_slug(self, raw_full_name):
+        try:
+            return self._candidate_slugs[raw_full_name]
+        except KeyError:
+            slug = slugify(raw_full_name, substitute='-')
+            self._candidate_slugs[raw_full_name] = slug
+            return slug
+
+
+class RunContext(object):
+    """
+    State shared by every file loaded by a loader during a run.
+
+    Election metadata is fetched from the datasource once, and each
+    election gets Contest and Candidate lookups that are kept for every
+    later file of that election.
+
+    Contests and Candidates have ids derived from their natural keys, so
+    the lookups never need to be read from Mongo: they hold the objects
+    this run has already upserted, which loaders add as they go, so each
+    object is written once per run.
+
+    """
+
+    def __init__(self, datasource):
+        self.datasource = datasource
+        self._elections = {}
+        self._lookups = {}
+
+    def election(self, election_id):
+        "Election metadata from the datasource, matched on election slug"
+        try:
+            return self._elections[election_id]
+        except KeyError:
+            year = int(re.search(r'\d{4}', election_id).group())
+            elecs = self.datasource.elections(year)[year]
+            elec_meta = [e for e in elecs if e['slug'] == election_id][0]
+            self._elections[election_id] = elec_meta
+            return elec_meta
+
+    def lookup(self, doc_klass, election_id):
+        "Dict of upserted Contests or Candidates for an election, by natural key"
+        return self._lookups.setdefault((doc_klass, election_id), {})
 
 
 class BaseLoader(StateBase):
@@ -15,16 +338,350 @@ class BaseLoader(StateBase):
     Intended to be subclassed in state-specific load.py modules.
     Reads from cached resources inside each state directory.
 
+    Results are written in batches of batch_size documents, which
+    subclasses can override.
+
+    Subclasses should bump loader_version whenever a change would alter
+    the Results produced from a file, so that files recorded in the
+    LoadLedger under an older version get reloaded.
+
+    Loaders using get_or_create_contest, get_or_create_candidate or
+    load_tabular must set self.run_context to a RunContext.
+
+    With dry_run set, files are parsed and converted to documents as
+    usual but nothing is read from or written to Mongo. Set stats to a
+    LoadStats to collect timings for a file.
+
     """
+    batch_size = 5000
+    loader_version = 1
+    dry_run = False
+    stats = None
 
     def __init__(self):
         super(BaseLoader, self).__init__()
+        # New raw parties by candidate id, written by flush_candidate_parties
+        self._cand_parties = {}
+        # New Contests and Candidates, written by flush_upserts
+        self._pending_upserts = []
         #TODO: use datasource.mappings instead
         #self.filenames = json.loads(open(join(self.mappings_dir,'filenames.json'), 'r').read())
 
     def run(self):
         raise NotImplementedError()
 
+    def bulk_inserter(self, doc_klass):
+        """Returns a BulkInserter for doc_klass using the loader's batch size,
+        or a MemorySink for dry runs"""
+        inserter_klass = MemorySink if self.dry_run else BulkInserter
+        return inserter_klass(doc_klass, self.batch_size, stats=self.stats,
+            before_flush=self.flush_upserts, stamp_updated=True)
+
+    def timed_rows(self, rows):
+        "Source rows, counted and timed if the loader is collecting stats"
+        if self.stats:
+            return self.stats.timed_rows(rows)
+        return rows
+
+    def clear_results(self, source):
+        """Delete Results previously loaded from a source file
+
+        The file's LoadLedger entry goes first, so a reload that fails
+        partway isn't later skipped as unchanged.
+        """
+        if self.dry_run:
+            return
+        LoadLedger.objects(source=source).delete()
+        results = Result.objects.filter(source=source)
+        result_count = results.count()
+        if result_count > 0:
+            print("\tDeleting %s previously loaded results" % result_count)
+            results.delete()
+
+    def upsert(self, obj):
+        """Insert a Contest or Candidate unless it already exists
+
+        The object's id is derived from its natural key, so concurrent
+        loaders upserting the same object all end up with one document,
+        and nothing needs to be read first. Objects saved before ids were
+        derived from keys are matched by the unique natural key index
+        instead, and obj takes the existing document's id.
+        """
+        obj.validate()
+        if self.dry_run:
+            return obj
+        pk, update = self._upsert_spec(obj)
+        collection = obj.__class__._get_collection()
+        try:
+            collection.update({'_id': pk}, update, upsert=True)
+        except DuplicateKeyError:
+            self._use_legacy_id(obj)
+        return obj
+
+    def _upsert_spec(self, obj):
+        """Id and update document for upserting obj
+
+        Only the updated timestamp is changed on existing documents, so
+        incremental transforms pick up objects seen again in a reload. It's
+        set to the time of the write rather than of the load's start, since
+        a transform may have started in between.
+        """
+        doc = obj.to_mongo()
+        pk = doc.pop('_id')
+        update = {'$setOnInsert': doc}
+        if 'updated' in obj._fields:
+            doc.pop('updated', None)
+            update['$set'] = {'updated': datetime.datetime.now()}
+        return pk, update
+
+    def _use_legacy_id(self, obj):
+        # Set obj's id to that of the existing document with its natural key
+        key_spec = [spec for spec in obj._meta['index_specs']
+                    if spec.get('unique')][0]
+        query = dict((name, getattr(obj, name))
+                     for name, _ in key_spec['fields'])
+        obj.pk = obj.__class__._get_collection().find_one(query,
+            fields=['_id'])['_id']
+
+    def bulk_upsert(self, objs):
+        """Upsert objects of a single Document class in one unordered
+        bulk op, as upsert does for a single object
+
+        Returns a dict mapping the derived ids of objects that matched
+        legacy documents to the ids those objects now have.
+        """
+        if not objs or self.dry_run:
+            return {}
+        bulk = objs[0].__class__._get_collection().initialize_unordered_bulk_op()
+        for obj in objs:
+            pk, update = self._upsert_spec(obj)
+            bulk.find({'_id': pk}).upsert().update_one(update)
+        try:
+            bulk.execute()
+        except BulkWriteError as e:
+            remapped = {}
+            for error in e.details['writeErrors']:
+                if error['code'] not in (11000, 11001):
+                    raise
+                obj = objs[error['index']]
+                pk = obj.pk
+                self._use_legacy_id(obj)
+                remapped[pk] = obj.pk
+            return remapped
+        return {}
+
+    def queue_upsert(self, obj):
+        """Validate obj and queue it to be upserted by flush_upserts
+
+        obj has its id derived from its natural key, so it can be
+        referenced right away.
+        """
+        obj.validate()
+        self._pending_upserts.append(obj)
+        return obj
+
+    def flush_upserts(self):
+        """Upsert queued Contests, then Candidates, in bulk
+
+        Returns a dict of ids changed by matching legacy documents, as
+        from bulk_upsert. Loaders' Result inserters call this before
+        writing each batch, so Results never reference objects that
+        haven't been written.
+        """
+        if not self._pending_upserts:
+            return {}
+        remapped = {}
+        for doc_klass in (Contest, Candidate):
+            objs = [obj for obj in self._pending_upserts
+                    if isinstance(obj, doc_klass)]
+            remapped.update(self.bulk_upsert(objs))
+        self._pending_upserts = []
+        if remapped:
+            self._cand_parties = dict((remapped.get(pk, pk), parties)
+                for pk, parties in self._cand_parties.items())
+        return remapped
+
+    def get_or_create_contest(self, ctx, raw_office, raw_district=None,
+                              party=None, **kwargs):
+        """Contest for an office in the context's election, queued to be
+        upserted the first time it's seen in a run"""
+        slug = ctx.contest_slug(raw_office, raw_district, party)
+        contests = self.run_context.lookup(Contest, ctx.election_id)
+        try:
+            return contests[(ctx.election_id, slug)]
+        except KeyError:
+            fields = {
+                'created': ctx.timestamp,
+                'source': ctx.source,
+                'election_id': ctx.election_id,
+                'slug': slug,
+                'state': ctx.state,
+                'start_date': ctx.start_date,
+                'end_date': ctx.end_date,
+                'election_type': ctx.election_type,
+                'result_type': ctx.result_type,
+                'special': ctx.special,
+                'raw_office': raw_office,
+                'raw_district': raw_district,
+            }
+            # Add party if it's a primary
+            if ctx.primary:
+                fields['raw_party'] = party
+            fields.update(kwargs)
+            contest = self.queue_upsert(Contest(**fields))
+            contests[contest.key] = contest
+            return contest
+
+    def get_or_create_candidate(self, ctx, contest, raw_full_name, **kwargs):
+        """Candidate in a contest, queued to be upserted the first time
+        it's seen in a run"""
+        slug = ctx.candidate_slug(raw_full_name)
+        candidates = self.run_context.lookup(Candidate, ctx.election_id)
+        try:
+            return candidates[(ctx.election_id, contest.slug, slug)]
+        except KeyError:
+            fields = {
+                'created': ctx.timestamp,
+                'source': ctx.source,
+                'election_id': ctx.election_id,
+                'contest': contest,
+                'contest_slug': contest.slug,
+                'state': ctx.state,
+                'raw_full_name': raw_full_name,
+                'slug': slug,
+            }
+            fields.update(kwargs)
+            candidate = self.queue_upsert(Candidate(**fields))
+            candidates[candidate.key] = candidate
+            return candidate
+
+    def add_candidate_party(self, candidate, raw_party):
+        """Queue a new raw party for a candidate
+
+        Parties are written in bulk by flush_candidate_parties, rather
+        than saving the candidate for every row.
+        """
+        if raw_party and raw_party not in candidate.raw_parties:
+            # Keep the cached candidate current so repeat rows are skipped
+            candidate.raw_parties.append(raw_party)
+            self._cand_parties.setdefault(candidate.pk, set()).add(raw_party)
+
+    def flush_candidate_parties(self):
+        "Add queued raw parties to candidates in a single unordered bulk op"
+        # The candidates must exist first
+        self.flush_upserts()
+        if not self._cand_parties or self.dry_run:
+            self._cand_parties = {}
+            return
+        bulk = Candidate._get_collection().initialize_unordered_bulk_op()
+        now = datetime.datetime.now()
+        for pk, parties in self._cand_parties.items():
+            bulk.find({'_id': pk}).update_one({
+                '$addToSet': {'raw_parties': {'$each': list(parties)}},
+                '$set': {'updated': now},
+            })
+        bulk.execute()
+        self._cand_parties = {}
+
+    def source_path(self, mapping):
+        """Path of the file loaded for a mapping, which is hashed for the
+        LoadLedger
+
+        Defaults to the mapping's cached file. Loaders that load a file
+        derived from it should override this.
+        """
+        return join(self.cache.abspath, mapping['generated_filename'])
+
+    def tabular_rows(self, mapping, spec):
+        "Rows of the cached file for a mapping, read as described by spec"
+        return tabular_file_rows(self.source_path(mapping), spec.delimiter,
+            spec.encoding)
+
+    def load_tabular(self, mapping, spec, ctx, rows=None):
+        """Load Results from a tabular file described by a TabularSpec
+
+        Rows are read lazily from the cached file, or from rows if
+        provided, and Results written in batches. Returns the number of
+        Results loaded.
+        """
+        if rows is None:
+            rows = self.tabular_rows(mapping, spec)
+        rows = iter(self.timed_rows(rows))
+        header = spec.fieldnames or next(rows)
+        transform = spec.compile(header, mapping)
+        results = self.bulk_inserter(Result)
+        for values in rows:
+            record = transform(values)
+            if record is None:
+                continue
+            party, contest_kwargs, candidate_kwargs, result_kwargs = record
+            contest = self.get_or_create_contest(ctx, party=party,
+                **contest_kwargs)
+            candidate = self.get_or_create_candidate(ctx, contest,
+                **candidate_kwargs)
+            self.add_candidate_party(candidate, party)
+            result_kwargs.update({
+                'source': ctx.source,
+                'election_id': ctx.election_id,
+                'state': ctx.state,
+                'contest': contest,
+                'contest_slug': contest.slug,
+                'candidate': candidate,
+                'candidate_slug': candidate.slug,
+            })
+            results.add(result_kwargs)
+        results.flush()
+        self.flush_candidate_parties()
+        return results.count
+
+    def content_hash(self, mapping):
+        """MD5 hex digest of the file loaded for a mapping
+
+        The digest is kept in the mapping's content_hash, so a file
+        checked by is_loaded isn't read again when its load is recorded,
+        including by a load_parallel worker.
+        """
+        try:
+            return mapping['content_hash']
+        except KeyError:
+            pass
+        md5 = hashlib.md5()
+        with open(self.source_path(mapping), 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), ''):
+                md5.update(chunk)
+        mapping['content_hash'] = md5.hexdigest()
+        return mapping['content_hash']
+
+    def is_loaded(self, mapping):
+        """True if the mapping's file was already loaded, unchanged,
+        by the current loader version"""
+        try:
+            entry = LoadLedger.objects.get(source=mapping['generated_filename'])
+        except LoadLedger.DoesNotExist:
+            return False
+        try:
+            content_hash = self.content_hash(mapping)
+        except IOError:
+            return False
+        return (entry.content_hash == content_hash and
+                entry.loader_version == self.loader_version)
+
+    def record_load(self, mapping, row_count):
+        "Record a loaded file in the LoadLedger"
+        if self.dry_run:
+            return
+        now = datetime.datetime.now()
+        LoadLedger.objects(source=mapping['generated_filename']).update_one(
+            upsert=True,
+            set__state=self.state.upper(),
+            set__election_id=mapping.get('election'),
+            set__content_hash=self.content_hash(mapping),
+            set__loader_version=self.loader_version,
+            set__row_count=row_count,
+            set__updated=now,
+            set_on_insert__created=now,
+        )
+
     def jurisdiction_mappings(self, headers):
         "Given a tuple of headers, returns a JSON object of jurisdictional mappings based on OCD ids"
         filename = join(self.mappings_dir, self.state+'.csv')
@@ -32,3 +689,207 @@ class BaseLoader(StateBase):
             reader = unicodecsv.DictReader(csvfile, fieldnames = headers)
             mappings = json.dumps([row for row in reader])
         return json.loads(mappings)
+
+
+# Loader instance for each worker process in load_parallel
+_worker_loader = None
+
+def reset_connections():
+    """Drop Mongo connections inherited from a parent process
+
+    Connections can't be shared with the parent after a fork, so worker
+    processes call this first. Documents reconnect lazily on next use.
+    """
+    disconnect()
+    for doc_klass in _document_registry.values():
+        doc_klass._collection = None
+
+def _init_worker(loader_klass, result_collection=None):
+    global _worker_loader
+    reset_connections()
+    _worker_loader = loader_klass()
+    if result_collection:
+        # Write Results to the same (staging) collection as the parent,
+        # for the lifetime of the worker
+        switch_collection(Result, result_collection).__enter__()
+
+def _load_mapping(mapping, loader=None):
+    """Load a mapping's file, returning its name and a formatted
+    traceback if loading failed
+
+    Exceptions are returned rather than raised so one bad file doesn't
+    stop the rest of a run.
+    """
+    try:
+        (loader or _worker_loader).run(mapping)
+    except Exception:
+        return mapping['generated_filename'], traceback.format_exc()
+    return mapping['generated_filename'], None
+
+def load_parallel(loader_klass, mappings, workers, result_collection=None):
+    """Load mappings in a pool of worker processes
+
+    Each worker creates its own loader_klass instance and Mongo connection.
+    Files are scheduled largest first, so a big file started late doesn't
+    hold up the end of the run. With one worker, files are loaded in
+    order in this process instead.
+
+    A file that fails to load doesn't stop the others. Once every file
+    has been tried, a RuntimeError lists the files that failed, with
+    their tracebacks.
+
+    Loaders must tolerate other processes creating the same contests and
+    candidates; see the unique natural key indexes on those models.
+
+    Results are written to result_collection instead of the Result
+    model's collection when provided, e.g. a StagedReload's collection.
+
+    USAGE
+
+        load_parallel(LoadResults, datasrc.mappings('2012'), 4)
+
+    """
+    if not mappings:
+        return
+    errors = []
+
+    def done(filename, error):
+        if error:
+            print("FAILED: %s" % filename)
+            errors.append("%s:\n%s" % (filename, error))
+        else:
+            print("DONE: %s" % filename)
+
+    if workers <= 1:
+        loader = loader_klass()
+
+        def load_all():
+            for mapping in mappings:
+                done(*_load_mapping(mapping, loader))
+
+        if result_collection:
+            with switch_collection(Result, result_collection):
+                load_all()
+        else:
+            load_all()
+    else:
+        cache = StateCache(loader_klass.__module__.split('.')[-2])
+
+        def file_size(mapping):
+            try:
+                return getsize(join(cache.abspath,
+                    mapping['generated_filename']))
+            except OSError:
+                return 0
+
+        jobs = sorted(mappings, key=file_size, reverse=True)
+        pool = Pool(workers, initializer=_init_worker,
+            initargs=(loader_klass, result_collection))
+        try:
+            for filename, error in pool.imap_unordered(_load_mapping, jobs):
+                done(filename, error)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+    if errors:
+        raise RuntimeError("%s of %s files failed to load\n%s" % (
+            len(errors), len(mappings), "\n".join(errors)))
+
+
+class StagedReload(object):
+    """
+    Reload Results for a set of elections in a state's Result partition
+    (see openelex.base.partition) into a staging collection, then swap it
+    into place.
+
+    Staging is seeded server-side with the partition's Results for other
+    elections. On entry, Result is switched to it, so loaders write there
+    without deleting anything from the live partition. Automatic index
+    creation is turned off meanwhile, so the load doesn't maintain any
+    indexes. On a clean exit Result's indexes are built on staging, in
+    the foreground, and it's renamed over the partition in a single
+    step. Readers see either the old or the new results, never a partial
+    load, and only the one state's Results are copied.
+
+    If loading or the swap fails, the staging collection is dropped, the
+    live collection is left untouched, and the LoadLedger entries for
+    the elections are deleted. Loaders record each file as soon as it
+    loads, so without that the next load would skip files whose new
+    Results never went live.
+
+    Raises ValueError unless Result is routed to a state's partition,
+    since swapping the shared result collection would copy every state.
+
+    Nothing else may write Results for the state while a staged reload
+    is running, since a partition's writes would be lost in the rename.
+    The partition's size is checked before the rename, and the swap is
+    abandoned with a RuntimeError if it changed.
+
+    USAGE
+
+        with result_partition('md'):
+            with StagedReload(['md-2012-11-06-general']) as staging:
+                for mapping in mappings:
+                    loader.run(mapping)
+
+    """
+
+    def __init__(self, election_ids):
+        self.live = Result._get_collection()
+        if not is_partitioned() or self.live.name == BASE_NAME:
+            raise ValueError("Staged reloads need Results partitioned by "
+                "state (RESULT_PARTITIONING = 'state' in settings.py)")
+        self.election_ids = sorted(set(election_ids))
+        self.name = self.live.name + '_staging'
+        self._switch = switch_collection(Result, self.name)
+
+    def __enter__(self):
+        db = self.live.database
+        db.drop_collection(self.name)
+        self.live_count = self.live.count()
+        # $out creates the staging collection even if nothing matches
+        self.live.aggregate([
+            {'$match': {self._election_field: {'$nin': self.election_ids}}},
+            {'$out': self.name},
+        ])
+        # Worker processes forked during the load inherit this
+        self._auto_create_index = Result._meta.get('auto_create_index', True)
+        Result._meta['auto_create_index'] = False
+        self._switch.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        staging = Result._get_collection()
+        self._switch.__exit__(exc_type, exc_value, traceback)
+        Result._meta['auto_create_index'] = self._auto_create_index
+        if exc_type is not None:
+            self._abandon(staging)
+            return
+        try:
+            self._swap(staging)
+        except:
+            self._abandon(staging)
+            raise
+
+    def _abandon(self, staging):
+        staging.drop()
+        LoadLedger.objects(election_id__in=self.election_ids).delete()
+
+    @property
+    def _election_field(self):
+        return Result._fields['election_id'].db_field
+
+    def _swap(self, staging):
+        for spec in Result._meta['index_specs']:
+            opts = dict(spec)
+            fields = opts.pop('fields')
+            # Built in the foreground so they're ready when staging goes live
+            opts['background'] = False
+            staging.create_index(fields, **opts)
+        if self.live.count() != self.live_count:
+            raise RuntimeError("%s changed during a staged reload; not "
+                "swapping in the staged results" % self.live.name)
+        staging.rename(self.live.name, dropTarget=True)
@@ -0,0 +1,131 @@
+"""
+Cached parsing of raw candidate names into name parts.
+
+The same raw names turn up in every county and precinct file and across
+elections, so each distinct name is parsed once per parser version and
+the parts are kept in memory and in the parsedname collection:
+
+    parts = name_cache.parse(u'Barack Obama')
+    ...
+    name_cache.flush()
+
+"""
+from collections import OrderedDict
+
+import nameparser
+from nameparser import HumanName
+
+from openelex.models import ParsedName
+
+# Bump the suffix when changing how parts are derived from HumanName
+PARSER_VERSION = 'nameparser-%s:1' % nameparser.__version__
+
+NAME_PARTS = ('given_name', 'family_name', 'additional_name', 'suffix')
+
+
+def parse_name(raw_name):
+    "Dict of name parts, by Candidate field, parsed from a raw name"
+    name = HumanName(raw_name)
+    return {
+        'given_name': name.first,
+        'family_name': name.last,
+        'additional_name': name.middle,
+        'suffix': name.suffix,
+    }
+
+
+class NameParseCache(object):
+    """
+    LRU cache of parsed names, backed by the parsedname collection.
+
+    Names missing from memory are looked up in Mongo, or parsed. Newly
+    parsed names are written to Mongo in bulk by flush(). Use prefetch()
+    to look up a batch of names with a single query rather than one per
+    name. With persist=False the cache is memory-only.
+
+    """
+
+    def __init__(self, max_size=50000, persist=True,
+                 parser_version=PARSER_VERSION):
+        self.max_size = max_size
+        self.persist = persist
+        self.parser_version = parser_version
+        self._cache = OrderedDict()
+        self._new = {}
+        # Names from the last prefetch that aren't stored yet
+        self._absent = set()
+        self.hits = 0
+        self.misses = 0
+
+    def _remember(self, raw_name, parts):
+        self._cache[raw_name] = parts
+        if len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    def prefetch(self, raw_names):
+        """Load stored parts for any of raw_names not already in memory
+
+        Names found missing are only remembered until the next prefetch,
+        so call this once per batch, before parsing the batch's names.
+        """
+        if not self.persist:
+            return
+        self._absent = set()
+        ids = dict((ParsedName.make_id(self.parser_version, raw_name),
+            raw_name) for raw_name in set(raw_names)
+            if raw_name not in self._cache)
+        if not ids:
+            return
+        fields = dict((part, 1) for part in NAME_PARTS)
+        found = set()
+        for doc in ParsedName._get_collection().find(
+                {'_id': {'$in': ids.keys()}}, fields=fields):
+            found.add(ids[doc['_id']])
+            self._remember(ids[doc['_id']],
+                dict((part, doc.get(part)) for part in NAME_PARTS))
+        self._absent.update(set(ids.values()) - found)
+
+    def parse(self, raw_name):
+        "Dict of name parts for a raw name"
+        try:
+            parts = self._cache.pop(raw_name)
+        except KeyError:
+            pass
+        else:
+            # Re-inserting marks the name as most recently used
+            self._cache[raw_name] = parts
+            self.hits += 1
+            return parts
+        self.misses += 1
+        parts = None
+        if (self.persist and raw_name not in self._new and
+                raw_name not in self._absent):
+            doc = ParsedName._get_collection().find_one(
+                ParsedName.make_id(self.parser_version, raw_name))
+            if doc:
+                parts = dict((part, doc.get(part)) for part in NAME_PARTS)
+        if parts is None:
+            parts = parse_name(raw_name)
+            self._absent.discard(raw_name)
+            if self.persist:
+                self._new[raw_name] = parts
+        self._remember(raw_name, parts)
+        return parts
+
+    def flush(self):
+        "Store names parsed since the last flush"
+        if not self._new:
+            return
+        bulk = ParsedName._get_collection().initialize_unordered_bulk_op()
+        for raw_name, parts in self._new.items():
+            doc = dict(parts, raw_name=raw_name,
+                parser_version=self.parser_version)
+            bulk.find({'_id': ParsedName.make_id(self.parser_version,
+                raw_name)}).upsert().update_one({'$setOnInsert': doc})
+        bulk.execute()
+        self._new = {}
+        self._absent = set()
+
+
+# Shared by transforms and loaders in a process
+name_cache = NameParseCache()
@@ -0,0 +1,116 @@
+"""
+Optional partitioning of Results into a collection per state.
+
+Set RESULT_PARTITIONING = 'state' in settings.py to store each state's
+Results in its own collection, e.g. result_md, so that reloading or
+deleting one state's Results doesn't contend with reads of other states,
+and each state's indexes only cover its own Results. Left unset, all
+Results share the result collection.
+
+Code working on a single state routes Result to its partition:
+
+    with result_partition('md'):
+        Result.objects.filter(election_id='md-2012-11-06-general').delete()
+
+and queries spanning states fan out across partitions:
+
+    for result in find_results(contest_slug='president-vice-pres'):
+        ...
+
+Result's reverse_delete_rule=CASCADE only reaches the collection Result
+is routed to at the time, so delete Contests and Candidates with
+delete_with_results, which removes their Results from every partition.
+
+"""
+from contextlib import contextmanager
+from itertools import chain
+
+from mongoengine.context_managers import switch_collection
+
+from openelex import settings
+from openelex.models import Candidate, Contest, Result
+
+BASE_NAME = Result._get_collection_name()
+
+
+def is_partitioned():
+    return getattr(settings, 'RESULT_PARTITIONING', None) == 'state'
+
+
+def partition_name(state):
+    """Name of the Result collection for a state, or None if Results
+    aren't partitioned"""
+    if not is_partitioned():
+        return None
+    return '%s_%s' % (BASE_NAME, state.lower())
+
+
+def partition_names():
+    "Names of every existing Result collection"
+    if not is_partitioned():
+        return [BASE_NAME]
+    prefix = BASE_NAME + '_'
+    return sorted(name for name in Result._get_db().collection_names()
+        if name.startswith(prefix) and len(name) == len(prefix) + 2)
+
+
+@contextmanager
+def result_partition(state):
+    """Route Result to a state's partition for the duration of the block
+
+    Does nothing if Results aren't partitioned.
+    """
+    name = partition_name(state)
+    if name is None:
+        yield Result
+        return
+    with switch_collection(Result, name) as doc_klass:
+        yield doc_klass
+
+
+def result_querysets(**filters):
+    """Result querysets for filters, one per partition
+
+    Only the state's partition is queried if filters include a state.
+    Each queryset stays bound to its partition, but Results fetched from
+    them are saved to whatever collection Result is routed to at the
+    time, so use result_partition to modify them.
+    """
+    state = filters.get('state')
+    if state and is_partitioned():
+        names = [partition_name(state)]
+    else:
+        names = partition_names()
+    querysets = []
+    for name in names:
+        with switch_collection(Result, name):
+            querysets.append(Result.objects.filter(**filters))
+    return querysets
+
+
+def find_results(**filters):
+    "Iterate over Results matching filters across all partitions"
+    return chain.from_iterable(result_querysets(**filters))
+
+
+def count_results(**filters):
+    return sum(qs.count() for qs in result_querysets(**filters))
+
+
+def delete_with_results(doc_klass, **filters):
+    """Delete Contests or Candidates matching filters, and their Results
+    in every partition
+
+    Returns the number of Contests or Candidates deleted.
+    """
+    field = {Contest: 'contest', Candidate: 'candidate'}[doc_klass]
+    objs = doc_klass.objects.filter(**filters)
+    count = objs.count()
+    result_filters = {field + '__in': list(objs.scalar('id'))}
+    if filters.get('state'):
+        result_filters['state'] = filters['state']
+    for qs in result_querysets(**result_filters):
+        qs.delete()
+    # Cascades to Candidates of deleted Contests, whose Results are gone
+    objs.delete()
+    return count
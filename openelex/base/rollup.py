@@ -0,0 +1,178 @@
+"""
+Materialized vote totals computed from loaded Results.
+
+ResultRollups are rebuilt an election at a time, for the elections whose
+files have been (re)loaded since their rollups were last built:
+
+    for election_id in stale_elections('md'):
+        rollup_election(election_id)
+
+"""
+from collections import OrderedDict
+from itertools import groupby
+import datetime
+
+from bson.son import SON
+
+from openelex.models import LoadLedger, Result, ResultRollup
+from .load import BulkInserter
+
+
+def _field(name):
+    "Reference to a Result field in an aggregation, by its db field name"
+    return '$' + Result._fields[name].db_field
+
+
+def rollup_pipeline(election_id, statewide=False):
+    """Aggregation pipeline totalling an election's Results by contest,
+    candidate, reporting level and, unless statewide, OCD id
+
+    Groups are sorted so that each contest's rows for a reporting level
+    are adjacent, in order of OCD id.
+    """
+    group_id = SON([
+        ('contest_slug', _field('contest_slug')),
+        ('reporting_level', _field('reporting_level')),
+        ('candidate_slug', _field('candidate_slug')),
+    ])
+    if not statewide:
+        group_id['ocd_id'] = _field('ocd_id')
+    return [
+        {'$match': {Result._fields['election_id'].db_field: election_id}},
+        {'$group': {
+            '_id': group_id,
+            'total_votes': {'$sum': _field('raw_total_votes')},
+            'result_count': {'$sum': 1},
+            'state': {'$first': _field('state')},
+            'jurisdiction': {'$first': _field('jurisdiction')},
+        }},
+        {'$sort': SON([
+            ('_id.contest_slug', 1),
+            ('_id.reporting_level', 1),
+            ('_id.ocd_id', 1),
+        ])},
+    ]
+
+
+def division_ocd_id(ocd_id, division='county'):
+    """OCD id of the division of a type, e.g. county, that contains a
+    jurisdiction, or the jurisdiction's own OCD id if it isn't inside
+    a division of that type
+
+    USAGE
+
+        >>> division_ocd_id('ocd-division/country:us/state:md/county:allegany/precinct:01-001')
+        'ocd-division/country:us/state:md/county:allegany'
+
+    """
+    marker = '/%s:' % division
+    start = ocd_id.find(marker)
+    if start == -1:
+        return ocd_id
+    end = ocd_id.find('/', start + len(marker))
+    return ocd_id if end == -1 else ocd_id[:end]
+
+
+def rollup_election(election_id, batch_size=5000, division='county'):
+    """Rebuild the ResultRollups for an election
+
+    Results are totalled by one aggregation for jurisdictions and one for
+    statewide totals. Jurisdiction totals are combined up to the division
+    of the given type containing each Result's OCD id, so e.g. precinct
+    Results are rolled up per county, and each group of candidates in a
+    contest and division is then ranked. A division's rollups only have
+    a jurisdiction name if some of their Results are for the division
+    itself. Results without an OCD id can't be placed in a division, so
+    they're left out of jurisdiction rollups, though not statewide ones,
+    and reported. Every rollup written gets the same updated timestamp.
+
+    Returns the number of rollups written.
+    """
+    ResultRollup.objects.filter(election_id=election_id).delete()
+    rollups = BulkInserter(ResultRollup, batch_size)
+    now = datetime.datetime.now()
+    collection = Result._get_collection()
+    skipped = 0
+    level_key = lambda row: (row['_id']['contest_slug'],
+        row['_id']['reporting_level'])
+    for statewide in (False, True):
+        rows = collection.aggregate(rollup_pipeline(election_id, statewide),
+            cursor={}, allowDiskUse=True)
+        for (contest_slug, reporting_level), level_rows in groupby(rows,
+                level_key):
+            # Candidate totals by division, then candidate
+            divisions = OrderedDict()
+            for row in level_rows:
+                state = row['state']
+                if statewide:
+                    ocd_id = 'ocd-division/country:us/state:%s' % state.lower()
+                    jurisdiction = None
+                else:
+                    row_ocd_id = row['_id'].get('ocd_id')
+                    if not row_ocd_id:
+                        skipped += row['result_count']
+                        continue
+                    ocd_id = division_ocd_id(row_ocd_id, division)
+                    jurisdiction = (row['jurisdiction']
+                        if row_ocd_id == ocd_id else None)
+                group = divisions.setdefault(ocd_id, {
+                    'state': state,
+                    'jurisdiction': jurisdiction,
+                    'candidates': OrderedDict(),
+                })
+                group['jurisdiction'] = group['jurisdiction'] or jurisdiction
+                totals = group['candidates'].setdefault(
+                    row['_id']['candidate_slug'], [0, 0])
+                totals[0] += row['total_votes']
+                totals[1] += row['result_count']
+            for ocd_id, group in divisions.items():
+                candidates = sorted(group['candidates'].items(),
+                    key=lambda item: item[1][0], reverse=True)
+                contest_total = sum(votes for _, (votes, _) in candidates)
+                rank = 0
+                prev_votes = None
+                for i, (candidate_slug, (votes, result_count)) in enumerate(
+                        candidates):
+                    # Tied candidates share a rank
+                    if votes != prev_votes:
+                        rank = i + 1
+                        prev_votes = votes
+                    rollups.add({
+                        'election_id': election_id,
+                        'state': group['state'],
+                        'contest_slug': contest_slug,
+                        'candidate_slug': candidate_slug,
+                        'reporting_level': reporting_level,
+                        'statewide': statewide,
+                        'ocd_id': ocd_id,
+                        'jurisdiction': group['jurisdiction'],
+                        'total_votes': votes,
+                        'contest_total_votes': contest_total,
+                        'rank': rank,
+                        'result_count': result_count,
+                        'updated': now,
+                    })
+    rollups.flush()
+    if skipped:
+        print("\tSkipped %s results without an OCD id in %s" % (skipped,
+            election_id))
+    return rollups.count
+
+
+def stale_elections(state):
+    """Ids of a state's elections with files loaded since their rollups
+    were last built, according to the LoadLedger"""
+    loaded = {}
+    for entry in LoadLedger.objects.filter(state=state.upper()).only(
+            'election_id', 'updated'):
+        if entry.election_id and entry.updated:
+            loaded[entry.election_id] = max(entry.updated,
+                loaded.get(entry.election_id, entry.updated))
+    stale = []
+    for election_id, updated in sorted(loaded.items()):
+        # All of an election's rollups share a timestamp, so any one will do
+        rollup = ResultRollup.objects.filter(election_id=election_id).only(
+            'updated').first()
+        if rollup is None or rollup.updated < updated:
+            stale.append(election_id)
+    return stale
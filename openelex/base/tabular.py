@@ -0,0 +1,294 @@
+"""
+Declarative layouts of tabular results files, and lazy readers for
+delimited files and spreadsheets.
+
+A TabularSpec maps a file's columns to Contest, Candidate and Result
+fields, and BaseLoader.load_tabular loads the rows read from a file
+through it:
+
+    spec = TabularSpec(
+        office=Column('Office Name'),
+        candidate=Column('Candidate Name'),
+        votes=Column('Total Votes', to_int),
+    )
+    loader.load_tabular(mapping, spec, ctx)
+
+"""
+from os.path import splitext
+import datetime
+
+import csv
+
+
+def strip(val):
+    return val.strip()
+
+def to_int(val):
+    """Vote count from a raw value, treating blanks as zero
+
+    USAGE
+
+        >>> to_int(u' 1,204.0 ')
+        1204
+
+    """
+    val = val.strip().replace(',', '')
+    if not val:
+        return 0
+    return int(float(val))
+
+
+class Column(object):
+    """
+    Source column for a field in a TabularSpec.
+
+    coerce converts the raw cell value, a unicode string. Columns that
+    aren't required give None for files that don't have them.
+
+    """
+
+    def __init__(self, source, coerce=strip, required=True):
+        self.source = source
+        self.coerce = coerce
+        self.required = required
+
+
+class TabularSpec(object):
+    """
+    Declarative mapping from the columns of a tabular results file, with
+    one result per row, to Contest, Candidate and Result fields.
+
+    office, candidate and votes are required, and map to Contest.raw_office,
+    Candidate.raw_full_name and Result.raw_total_votes. candidate can also
+    be a tuple of Columns, e.g. name parts, which are joined with spaces.
+    district maps to Contest.raw_district. party is stored as Result.party,
+    added to Candidate.raw_parties and, for primaries, used as the
+    Contest's raw_party.
+
+    contest_fields, candidate_fields and result_fields map other fields to
+    Columns. result_fields values can also be functions of (row, mapping),
+    where row is a dict of the row's values by column name, for fields
+    derived from several columns. A dotted result field name such as
+    'raw_vote_breakdowns.absentee_total' sets a key of a dict field.
+    mapping_fields sets Result fields from keys of the file's mapping.
+
+    Rows are dropped when offices is provided and doesn't include the
+    row's raw office, or when skip(contest_kwargs, candidate_kwargs,
+    result_kwargs) returns True.
+
+    compile() resolves column positions from a file's header once, and
+    returns a function that converts a row's values straight to kwargs.
+    BaseLoader.load_tabular runs it over a file. Files can be delimited
+    text or .xls/.xlsx workbooks, whose sheets are read as one file.
+
+    USAGE
+
+        spec = TabularSpec(
+            office=Column('Office Name'),
+            candidate=Column('Candidate Name'),
+            votes=Column('Total Votes', to_int),
+            reporting_level='county',
+            mapping_fields={'ocd_id': 'ocd_id', 'jurisdiction': 'name'},
+        )
+
+    """
+
+    def __init__(self, office, candidate, votes, district=None, party=None,
+                 contest_fields=None, candidate_fields=None, result_fields=None,
+                 mapping_fields=None, reporting_level='county', offices=None,
+                 skip=None, fieldnames=None, delimiter=',', encoding='latin-1'):
+        self.office = office
+        self.candidate = candidate
+        self.votes = votes
+        self.district = district
+        self.party = party
+        self.contest_fields = contest_fields or {}
+        self.candidate_fields = candidate_fields or {}
+        self.result_fields = result_fields or {}
+        self.mapping_fields = mapping_fields or {}
+        self.reporting_level = reporting_level
+        self.offices = offices
+        self.skip = skip
+        self.fieldnames = fieldnames
+        self.delimiter = delimiter
+        self.encoding = encoding
+
+    def compile(self, header, mapping):
+        """Returns a function converting a row's values to a tuple of
+        (party, contest kwargs, candidate kwargs, result kwargs), or None
+        for rows that should be skipped"""
+        header = [name.strip() for name in header]
+        index = dict((name, i) for i, name in enumerate(header))
+        width = len(header)
+
+        def getter(column):
+            try:
+                i = index[column.source]
+            except KeyError:
+                if column.required:
+                    raise KeyError("Column '%s' not found in %s" %
+                        (column.source, mapping['generated_filename']))
+                return lambda values: None
+            coerce = column.coerce
+            return lambda values: coerce(values[i])
+
+        def getters(fields):
+            return [(field, getter(column)) for field, column in fields.items()]
+
+        get_office = getter(self.office)
+        get_votes = getter(self.votes)
+        get_district = self.district and getter(self.district)
+        get_party = self.party and getter(self.party)
+        if isinstance(self.candidate, Column):
+            get_name = getter(self.candidate)
+        else:
+            name_parts = [getter(column) for column in self.candidate]
+            get_name = lambda values: u" ".join(part for part in
+                (get(values) for get in name_parts) if part)
+        contest_getters = getters(self.contest_fields)
+        candidate_getters = getters(self.candidate_fields)
+        result_getters = []
+        breakdown_getters = []
+        row_funcs = []
+        for field, column in self.result_fields.items():
+            if not isinstance(column, Column):
+                row_funcs.append((field, column))
+            elif '.' in field:
+                field, key = field.split('.', 1)
+                breakdown_getters.append((field, key, getter(column)))
+            else:
+                result_getters.append((field, getter(column)))
+        static = {'reporting_level': self.reporting_level}
+        for field, key in self.mapping_fields.items():
+            static[field] = mapping[key]
+        offices = self.offices
+        skip = self.skip
+
+        def transform(values):
+            if len(values) < width:
+                values = list(values) + [u''] * (width - len(values))
+            office = get_office(values)
+            if offices is not None and office not in offices:
+                return None
+            contest_kwargs = {'raw_office': office}
+            if get_district:
+                contest_kwargs['raw_district'] = get_district(values)
+            for field, get in contest_getters:
+                contest_kwargs[field] = get(values)
+            candidate_kwargs = {'raw_full_name': get_name(values)}
+            for field, get in candidate_getters:
+                candidate_kwargs[field] = get(values)
+            result_kwargs = dict(static)
+            result_kwargs['raw_total_votes'] = get_votes(values)
+            for field, get in result_getters:
+                result_kwargs[field] = get(values)
+            for field, key, get in breakdown_getters:
+                val = get(values)
+                if val is not None:
+                    result_kwargs.setdefault(field, {})[key] = val
+            if row_funcs:
+                row = dict(zip(header, values))
+                for field, func in row_funcs:
+                    result_kwargs[field] = func(row, mapping)
+            party = get_party and get_party(values)
+            if party is not None:
+                result_kwargs['party'] = party
+            if skip and skip(contest_kwargs, candidate_kwargs, result_kwargs):
+                return None
+            return party, contest_kwargs, candidate_kwargs, result_kwargs
+
+        return transform
+
+
+def csv_rows(path, delimiter=',', encoding='latin-1'):
+    """Lazily read rows of a delimited file as lists of unicode values"""
+    with open(path, 'rU') as f:
+        for row in csv.reader(f, delimiter=delimiter):
+            yield [val.decode(encoding) for val in row]
+
+
+def cell_text(val):
+    """Convert a spreadsheet cell value to unicode like a CSV field
+
+    Empty cells become empty strings and whole-number floats lose their
+    trailing ".0", so spreadsheet rows can use the same coercions as
+    rows read from CSV files.
+    """
+    if val is None:
+        return u''
+    if isinstance(val, float) and val.is_integer():
+        return unicode(int(val))
+    if isinstance(val, (datetime.date, datetime.datetime)):
+        return unicode(val.isoformat())
+    return unicode(val)
+
+
+def _sheet_rows(sheets):
+    # Workbooks often repeat the header row at the top of every sheet.
+    # Only the first one is kept so the rows read like a single file.
+    header = None
+    for sheet in sheets:
+        for i, row in enumerate(sheet):
+            if i == 0 and header is not None and row == header:
+                continue
+            if header is None:
+                header = row
+            yield row
+
+
+def xlsx_rows(path):
+    """Lazily read rows of every sheet of an .xlsx workbook
+
+    The workbook is opened in openpyxl's read-only mode, which parses
+    each sheet's XML as it's iterated rather than building the whole
+    workbook in memory.
+    """
+    # Imported here so loaders that only read CSVs don't need openpyxl
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheets = (([cell_text(cell.value) for cell in row]
+            for row in sheet.iter_rows()) for sheet in workbook.worksheets)
+        for row in _sheet_rows(sheets):
+            yield row
+    finally:
+        workbook.close()
+
+
+def xls_rows(path):
+    """Lazily read rows of every sheet of an .xls workbook
+
+    Sheets are loaded on demand, one at a time, and unloaded once their
+    rows have been read.
+    """
+    import xlrd
+
+    book = xlrd.open_workbook(path, on_demand=True)
+
+    def sheets():
+        for name in book.sheet_names():
+            sheet = book.sheet_by_name(name)
+            yield ([cell_text(val) for val in sheet.row_values(i)]
+                for i in xrange(sheet.nrows))
+            book.unload_sheet(name)
+
+    try:
+        for row in _sheet_rows(sheets()):
+            yield row
+    finally:
+        book.release_resources()
+
+
+def tabular_file_rows(path, delimiter=',', encoding='latin-1'):
+    """Lazily read rows of a delimited file or spreadsheet
+
+    The reader is picked from the file's extension. delimiter and
+    encoding only apply to delimited files.
+    """
+    ext = splitext(path)[1].lower()
+    if ext == '.xlsx':
+        return xlsx_rows(path)
+    if ext == '.xls':
+        return xls_rows(path)
+    return csv_rows(path, delimiter, encoding)
@@ -1,22 +1,129 @@
-import os
-import re
-import sys
+"""
+Registry and scheduler for transforms run on data loaded in MongoDB.
+
+Transforms declare the collections or fields they read and write, and any
+other transforms they depend on, when they're registered:
+
+    registry.register('md', parse_names_after_2002,
+        inputs=['candidate.raw_full_name'],
+        outputs=['candidate.given_name', 'candidate.family_name'])
+
+A transform depends on every transform registered before it for the same
+state whose outputs overlap its inputs or outputs, or whose inputs overlap
+its outputs, as well as on those named in depends_on. 'candidate' overlaps
+every 'candidate.<field>'. Transforms without declared inputs or outputs
+are assumed to touch everything, so run after all earlier transforms.
+
+Transforms run with Result routed to the state's partition, if Results
+are partitioned by state. Transforms whose dependencies have finished
+run concurrently:
+
+    timings = run_transforms('md', workers=4)
+
+Transforms registered with incremental=True are called with a since
+keyword argument: None the first time they run for a state, then the
+time their last successful run started. They only need to process
+documents whose updated timestamp is at least since, which loaders set
+to the time they write every Contest, Candidate and Result:
+
+    def parse_names(since=None):
+        query = {'state': 'MD'}
+        query.update(changed_since(Candidate, since))
+        ...
+
+Transforms shouldn't set updated themselves, or they'd see their own
+changes on their next run. Nor should loads and transforms for a state
+run at the same time: a batch timestamped just before a transform starts
+but written after its queries can be missed by both it and its next run.
+
+CPU-bound transforms can spread a function of each document over every
+core with map_documents, which splits a collection into _id ranges
+processed by separate worker processes:
+
+    def parse_name(cand):
+        return {'$set': parse_name_parts(cand['raw_full_name'])}
+
+    map_documents(Candidate, parse_name, {'state': 'MD'},
+        fields=['raw_full_name'])
+
+"""
 from collections import OrderedDict
+from multiprocessing import Pool, cpu_count, current_process
+from Queue import Queue
+import datetime
+import time
+import traceback
 
+from openelex.models import TransformWatermark
+from .load import reset_connections
+from .partition import result_partition
 from .state import StateBase
 
 
+def _overlaps(names, other_names):
+    "Whether any collection or collection.field in names overlaps other_names"
+    for name in names:
+        for other in other_names:
+            if (name == other or name.startswith(other + '.') or
+                    other.startswith(name + '.')):
+                return True
+    return False
+
+
+class Transform(object):
+    """A registered transform function and what it reads and writes
+
+    Calling a Transform calls its function.
+    """
+
+    def __init__(self, func, inputs=None, outputs=None, depends_on=(),
+                 incremental=False):
+        self.func = func
+        self.name = func.func_name
+        self.inputs = tuple(inputs) if inputs is not None else None
+        self.outputs = tuple(outputs) if outputs is not None else None
+        self.depends_on = tuple(depends_on)
+        self.incremental = incremental
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def __repr__(self):
+        return '<Transform: %s>' % self.name
+
+    @property
+    def declared(self):
+        return self.inputs is not None and self.outputs is not None
+
+    def conflicts(self, other):
+        "Whether this transform and other can't safely run at the same time"
+        if not (self.declared and other.declared):
+            return True
+        return (_overlaps(self.outputs, other.outputs) or
+            _overlaps(self.outputs, other.inputs) or
+            _overlaps(self.inputs, other.outputs))
+
+
 class Registry(StateBase):
 
     _registry = {}
 
-    def register(self, state, func):
+    def register(self, state, func, inputs=None, outputs=None, depends_on=(),
+                 incremental=False):
+        """Register a transform function for a state
+
+        inputs and outputs are lists of collection names or
+        collection.field names read and written by the transform.
+        depends_on is a list of names of transforms that must run first.
+        incremental transforms are passed the time of their last run.
+        """
         try:
             state_xforms = self._registry[state]
         except KeyError:
             self._registry[state] = OrderedDict()
             state_xforms = self._registry[state]
-        state_xforms[func.func_name] = func
+        state_xforms[func.func_name] = Transform(func, inputs, outputs,
+            depends_on, incremental)
 
     def get(self, state, func_name):
         try:
@@ -29,5 +136,274 @@ class Registry(StateBase):
     def all(self, state):
         return self._registry[state]
 
+    def dependencies(self, state):
+        """Dict mapping the name of each of a state's transforms to the set
+        of names of transforms that must finish before it starts"""
+        transforms = self.all(state)
+        deps = OrderedDict()
+        earlier = []
+        for name, transform in transforms.items():
+            for dep in transform.depends_on:
+                if dep not in transforms:
+                    raise KeyError("Transform (%s) depends on %s, which isn't "
+                        "registered for %s" % (name, dep, state))
+            deps[name] = set(transform.depends_on)
+            deps[name].update(other.name for other in earlier
+                if transform.conflicts(other))
+            earlier.append(transform)
+        return deps
+
+    def plan(self, state, include=None, exclude=None):
+        """Names of a state's transforms to run, in order of execution,
+        mapped to the names of included transforms they wait for
+
+        Dependencies on transforms left out by include or exclude are
+        assumed to be satisfied already.
+        """
+        deps = self.dependencies(state)
+        names = [name for name in deps
+            if (include is None or name in include) and
+                (exclude is None or name not in exclude)]
+        selected = set(names)
+        pending = OrderedDict((name, deps[name] & selected) for name in names)
+        plan = OrderedDict()
+        while pending:
+            ready = [name for name, waits in pending.items()
+                if not waits - set(plan)]
+            if not ready:
+                raise ValueError("Transforms for %s have circular dependencies: "
+                    "%s" % (state, ', '.join(pending)))
+            for name in ready:
+                plan[name] = pending.pop(name)
+        return plan
+
 # Global object for registering transform functions
 registry = Registry()
+
+
+def changed_since(doc_klass, since):
+    """Raw query selecting documents loaded at or after since, or
+    every document if since is None"""
+    if since is None:
+        return {}
+    return {doc_klass._fields['updated'].db_field: {'$gte': since}}
+
+def get_watermark(state, name):
+    "Start time of a transform's last successful run for a state, or None"
+    entry = TransformWatermark.objects.filter(state=state.upper(),
+        transform=name).only('watermark').first()
+    return entry.watermark if entry else None
+
+def set_watermark(state, name, watermark):
+    TransformWatermark.objects(state=state.upper(), transform=name).update_one(
+        upsert=True,
+        set__watermark=watermark,
+        set__updated=datetime.datetime.now(),
+    )
+
+def _init_worker():
+    reset_connections()
+
+def _run_transform(state, name, full=False):
+    """Run a registered transform, returning its name, elapsed seconds
+    and a formatted traceback if it failed
+
+    Incremental transforms are passed their watermark, unless full, and
+    have it advanced to their start time if they succeed. Result is
+    routed to the state's partition while the transform runs.
+
+    Exceptions are returned rather than raised, since Pool.apply_async
+    callbacks aren't called for failed tasks.
+    """
+    start = time.time()
+    try:
+        transform = registry.get(state, name)
+        with result_partition(state):
+            if transform.incremental:
+                started = datetime.datetime.now()
+                since = None if full else get_watermark(state, name)
+                transform(since=since)
+                set_watermark(state, name, started)
+            else:
+                transform()
+    except Exception:
+        return name, time.time() - start, traceback.format_exc()
+    return name, time.time() - start, None
+
+def run_transforms(state, include=None, exclude=None, workers=1, full=False):
+    """Run a state's transforms in dependency order
+
+    With more than one worker, transforms run in a pool of worker
+    processes as soon as the transforms they depend on have finished.
+    Transforms must already be registered, i.e. the state's transform
+    module imported, before calling this.
+
+    Incremental transforms only process what's changed since their last
+    run, unless full is provided.
+
+    Returns an OrderedDict of elapsed seconds by transform name, in
+    order of completion. Raises RuntimeError if a transform fails, after
+    waiting for running transforms to finish.
+    """
+    plan = registry.plan(state, include, exclude)
+    timings = OrderedDict()
+    if workers <= 1 or len(plan) <= 1:
+        for name in plan:
+            print 'Executing %s' % name
+            name, elapsed, error = _run_transform(state, name, full)
+            if error:
+                raise RuntimeError("Transform %s failed:\n%s" % (name, error))
+            timings[name] = elapsed
+            print 'DONE: %s (%.2fs)' % (name, elapsed)
+        return timings
+
+    finished = Queue()
+    pending = plan.copy()
+    running = set()
+    errors = []
+    pool = Pool(workers, initializer=_init_worker)
+    try:
+        while pending or running:
+            if not errors:
+                for name, waits in pending.items():
+                    if not waits - set(timings):
+                        print 'Executing %s' % name
+                        del pending[name]
+                        running.add(name)
+                        pool.apply_async(_run_transform, (state, name, full),
+                            callback=finished.put)
+            if not running:
+                break
+            name, elapsed, error = finished.get()
+            running.remove(name)
+            if error:
+                errors.append("Transform %s failed:\n%s" % (name, error))
+                continue
+            timings[name] = elapsed
+            print 'DONE: %s (%.2fs)' % (name, elapsed)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    if errors:
+        raise RuntimeError('\n'.join(errors))
+    return timings
+
+
+def id_ranges(collection, query, shards):
+    """Split the documents in collection matching query into up to shards
+    ranges of _ids of about the same size
+
+    Returns a list of (first, last) _id bounds, where first is inclusive,
+    last exclusive, and None leaves a range open-ended.
+    """
+    count = collection.find(query).count()
+    step = count // shards
+    bounds = [None]
+    if step:
+        for i in range(1, shards):
+            docs = list(collection.find(query, fields=['_id']).sort(
+                '_id', 1).skip(i * step).limit(1))
+            if docs and docs[0]['_id'] != bounds[-1]:
+                bounds.append(docs[0]['_id'])
+    bounds.append(None)
+    return zip(bounds[:-1], bounds[1:])
+
+def _range_query(query, first, last):
+    id_range = {}
+    if first is not None:
+        id_range['$gte'] = first
+    if last is not None:
+        id_range['$lt'] = last
+    if not id_range:
+        return query
+    return {'$and': [query, {'_id': id_range}]}
+
+def _map_shard(args):
+    """Apply a map_documents function to the documents in one _id range,
+    returning the number of documents updated"""
+    (doc_klass, collection_name, func, query, fields, batch_size, prepare,
+        finish, first, last) = args
+    collection = doc_klass._get_collection()
+    if collection.name != collection_name:
+        # doc_klass was switched to another collection, e.g. a partition
+        collection = collection.database[collection_name]
+    docs = collection.find(_range_query(query, first, last),
+        fields=fields).batch_size(batch_size)
+    updated = 0
+    batch = []
+    for doc in docs:
+        batch.append(doc)
+        if len(batch) == batch_size:
+            updated += _update_batch(collection, batch, func, prepare, finish)
+            batch = []
+    if batch:
+        updated += _update_batch(collection, batch, func, prepare, finish)
+    return updated
+
+def _update_batch(collection, docs, func, prepare, finish):
+    if prepare:
+        prepare(docs)
+    bulk = collection.initialize_unordered_bulk_op()
+    updated = 0
+    for doc in docs:
+        update = func(doc)
+        if update:
+            bulk.find({'_id': doc['_id']}).update_one(update)
+            updated += 1
+    if updated:
+        bulk.execute()
+    if finish:
+        finish()
+    return updated
+
+def map_documents(doc_klass, func, query=None, fields=None, workers=None,
+                  batch_size=1000, prepare=None, finish=None):
+    """Update every doc_klass document matching a raw query with func
+
+    func is called with each document, as a dict limited to fields if
+    provided, and returns an update document such as {'$set': {...}}, or
+    None to leave the document alone. Updates are written in unordered
+    bulk ops of up to batch_size documents. prepare, if provided, is
+    called with each batch of documents before func, e.g. to look up
+    something for the whole batch at once, and finish once each batch's
+    updates are written, e.g. to flush a cache.
+
+    Results are read from and written to the collection Result is routed
+    to, e.g. a state's partition inside run_transforms or result_partition.
+
+    Documents are split into _id ranges processed by a pool of worker
+    processes, cpu_count() by default, each with its own Mongo
+    connection, so func, prepare and finish must be module-level
+    functions. Inside a daemonic process, such as a run_transforms
+    worker, which can't start a pool of its own, documents are processed
+    in the calling process.
+
+    Returns the number of documents updated.
+    """
+    query = query or {}
+    if workers is None:
+        workers = cpu_count()
+    if current_process().daemon:
+        workers = 1
+    collection = doc_klass._get_collection()
+    args = (doc_klass, collection.name, func, query, fields, batch_size,
+        prepare, finish)
+    if workers <= 1:
+        return _map_shard(args + (None, None))
+
+    # Several ranges per worker, so a slow range doesn't hold up the end
+    shards = [args + id_range
+        for id_range in id_ranges(collection, query, workers * 4)]
+    pool = Pool(min(workers, len(shards)), initializer=_init_worker)
+    try:
+        updated = sum(pool.imap_unordered(_map_shard, shards))
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return updated
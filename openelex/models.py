@@ -1,4 +1,7 @@
 import datetime
+import hashlib
+
+from bson import ObjectId
 from mongoengine import *
 from mongoengine.fields import (
     BooleanField,
@@ -7,11 +10,28 @@ from mongoengine.fields import (
     EmbeddedDocumentField,
     IntField,
     ListField,
+    MapField,
     StringField,
 )
 from openelex.us import STATE_POSTALS
 
 
+def key_id(key):
+    """ObjectId derived from a natural key tuple
+
+    The same key always gives the same id, so loaders can reference and
+    upsert documents without first looking them up.
+
+    USAGE
+
+        >>> key_id(('md-2012-11-06-general', 'us-senate'))
+        ObjectId('...')
+
+    """
+    bits = u'|'.join(key).encode('utf-8')
+    return ObjectId(hashlib.md5(bits).digest()[:12])
+
+
 class Office(EmbeddedDocument):
     state = StringField(choices=STATE_POSTALS)
     name = StringField()
@@ -39,6 +59,22 @@ class Contest(DynamicDocument):
     district = StringField()
     party = StringField(help_text="This should only be assigned for closed primaries, where voters must be registered in party to vote in the contest")
 
+    meta = {
+        'indexes': [
+            # Natural key. Unique so concurrent loaders can't create duplicates.
+            # Also serves lookups and distinct slugs by election.
+            {'fields': ['election_id', 'slug'], 'unique': True},
+            ['state', 'election_id'],
+            # Incremental transforms select what's changed since their last run
+            ['state', 'updated'],
+        ],
+        'index_background': True,
+        # Built by db.ensure_indexes, once db.dedupe has merged any
+        # duplicates, rather than on first use, where existing duplicates
+        # would make every query fail
+        'auto_create_index': False,
+    }
+
     def __unicode__(self):
         return u'%s-%s' % self.key
 
@@ -46,6 +82,15 @@ class Contest(DynamicDocument):
     def key(self):
         return (self.election_id, self.slug)
 
+    @classmethod
+    def make_id(cls, election_id, slug):
+        return key_id((election_id, slug))
+
+    def clean(self):
+        # Default to an id derived from the natural key
+        if self.pk is None:
+            self.pk = self.make_id(*self.key)
+
 
 class Candidate(DynamicDocument):
     """
@@ -63,6 +108,8 @@ class Candidate(DynamicDocument):
     }
 
     """
+    created = DateTimeField()
+    updated = DateTimeField()
     source = StringField(required=True, help_text="Name of data source (preferably from datasource.py). NOTE: this could be a single file among many for a given state, if results are split into different files by reporting level")
     election_id = StringField(required=True, help_text="election id, e.g. md-2012-11-06-general")
     contest = ReferenceField(Contest, reverse_delete_rule=CASCADE, required=True)
@@ -87,6 +134,23 @@ class Candidate(DynamicDocument):
     parties = ListField(StringField(), default=list) # normalized? abbreviations?
     identifiers = DictField()
 
+    meta = {
+        'indexes': [
+            # Natural key. Unique so concurrent loaders can't create duplicates.
+            # Also serves lookups by election and contest.
+            {'fields': ['election_id', 'contest_slug', 'slug'], 'unique': True},
+            # Transforms select a state's candidates by election
+            ['state', 'election_id'],
+            # A candidate's candidacies across elections
+            ['slug', 'election_id'],
+            # Incremental transforms select what's changed since their last run
+            ['state', 'updated'],
+        ],
+        'index_background': True,
+        # See Contest
+        'auto_create_index': False,
+    }
+
     def __unicode__(self):
         name =  u'%s - %s' % (self.contest_slug, self.name)
         parties = ""
@@ -110,8 +174,24 @@ class Candidate(DynamicDocument):
     def key(self):
         return (self.election_id, self.contest_slug, self.slug)
 
+    @classmethod
+    def make_id(cls, election_id, contest_slug, slug):
+        return key_id((election_id, contest_slug, slug))
+
+    def clean(self):
+        # Default to an id derived from the natural key
+        if self.pk is None:
+            self.pk = self.make_id(*self.key)
 
-class Result(DynamicDocument):
+
+class Result(Document):
+    """
+    Results are by far the most numerous documents, so they're stored
+    compactly: fields have short db_field names, the schema is fixed, and
+    vote breakdowns are integers. Raw pymongo queries and aggregations
+    must use the db_field names, e.g. Result._fields['election_id'].db_field.
+
+    """
 
     REPORTING_LEVEL_CHOICES = (
         'state',
@@ -121,28 +201,47 @@ class Result(DynamicDocument):
         'precinct',
         'parish',
     )
-    source = StringField(required=True, help_text="Name of data source for this file, preferably standardized filename from datasource.py")
-    election_id = StringField(required=True, help_text="election id, e.g. md-2012-11-06-general")
-    state = StringField(required=True, choices=STATE_POSTALS)
-    reporting_level = StringField(required=True, choices=REPORTING_LEVEL_CHOICES)
-    contest = ReferenceField(Contest, reverse_delete_rule=CASCADE, required=True)
-    contest_slug = StringField(required=True, help_text="Denormalized contest slug for easier querying and obj repr")
-    candidate = ReferenceField(Candidate, reverse_delete_rule=CASCADE, required=True)
-    candidate_slug = StringField(required=True, help_text="Denormalized candidate slug for easier querying and obj repr")
-    ocd_id = StringField()
+    source = StringField(required=True, db_field='src', help_text="Name of data source for this file, preferably standardized filename from datasource.py")
+    election_id = StringField(required=True, db_field='eid', help_text="election id, e.g. md-2012-11-06-general")
+    state = StringField(required=True, db_field='st', choices=STATE_POSTALS)
+    reporting_level = StringField(required=True, db_field='lvl', choices=REPORTING_LEVEL_CHOICES)
+    # CASCADE only reaches the collection Result is routed to. Use
+    # openelex.base.partition.delete_with_results when Results are partitioned
+    contest = ReferenceField(Contest, reverse_delete_rule=CASCADE, required=True, db_field='con')
+    contest_slug = StringField(required=True, db_field='con_s', help_text="Denormalized contest slug for easier querying and obj repr")
+    candidate = ReferenceField(Candidate, reverse_delete_rule=CASCADE, required=True, db_field='cand')
+    candidate_slug = StringField(required=True, db_field='cand_s', help_text="Denormalized candidate slug for easier querying and obj repr")
+    ocd_id = StringField(db_field='ocd')
     #TODO: Add validation to require raw_jurisdiction or jurisdiction
-    raw_jurisdiction = StringField(help_text="Political geography from raw results, if present. E.g. county name, congressional district, precinct number.")
-    raw_total_votes = IntField(required=True)
-    raw_winner = StringField()
-    raw_write_in = StringField()
-    raw_vote_breakdowns = DictField(help_text="If provided, store vote totals for election day, absentee, provisional, etc.")
-
-    jurisdiction = StringField(help_text="Derived/standardized political geography, typically when not found in raw results.")
-    total_votes = IntField()
-    winner = BooleanField(help_text="Winner as determined by OpenElex, if not provided natively in data")
-    write_in = BooleanField()
+    raw_jurisdiction = StringField(db_field='r_jur', help_text="Political geography from raw results, if present. E.g. county name, congressional district, precinct number.")
+    raw_total_votes = IntField(required=True, db_field='r_votes')
+    raw_winner = StringField(db_field='r_win')
+    raw_write_in = StringField(db_field='r_wi')
+    raw_vote_breakdowns = MapField(IntField(), db_field='r_vb', help_text="If provided, store vote totals for election day, absentee, provisional, etc.")
+    party = StringField(db_field='pty', help_text="Raw party of the candidate on this result, if provided")
+    updated = DateTimeField(db_field='upd', help_text="When the result was written. Results are deleted and reinserted when their file is reloaded.")
+
+    jurisdiction = StringField(db_field='jur', help_text="Derived/standardized political geography, typically when not found in raw results.")
+    total_votes = IntField(db_field='votes')
+    winner = BooleanField(db_field='win', help_text="Winner as determined by OpenElex, if not provided natively in data")
+    write_in = BooleanField(db_field='wi')
     #vote_breakdowns = DictField(help_text="If provided, store vote totals for election day, absentee, provisional, etc.")
 
+    meta = {
+        'indexes': [
+            # Loaders delete a file's results before reloading it
+            'source',
+            ['election_id', 'contest_slug', 'candidate_slug'],
+            ['state', 'election_id', 'reporting_level'],
+            # Cascading deletes of contests and candidates
+            'contest',
+            'candidate',
+            # Incremental transforms select what's changed since their last run
+            ['state', 'updated'],
+        ],
+        'index_background': True,
+    }
+
     def __unicode__(self):
         bits = (
             self.election_id,
@@ -153,3 +252,109 @@ class Result(DynamicDocument):
             self.raw_total_votes,
         )
         return u'%s-%s-%s-%s-%s (%s)' % bits
+
+
+class ResultRollup(Document):
+    """
+    Precomputed vote totals for a candidate in a contest, summed over the
+    Results of one reporting level for a jurisdiction, or statewide.
+
+    Rollups are rebuilt per election by openelex.base.rollup from the
+    Results in Mongo, so consumers can read contest totals and rankings
+    without aggregating Results themselves.
+
+    """
+    election_id = StringField(required=True, help_text="election id, e.g. md-2012-11-06-general")
+    state = StringField(required=True, choices=STATE_POSTALS)
+    contest_slug = StringField(required=True)
+    candidate_slug = StringField(required=True)
+    reporting_level = StringField(required=True, choices=Result.REPORTING_LEVEL_CHOICES, help_text="Reporting level of the Results that were summed")
+    statewide = BooleanField(default=False, help_text="Sum of all jurisdictions at the reporting level, rather than of one jurisdiction")
+    ocd_id = StringField(help_text="OCD id of the division, e.g. county, containing the Results, or of the state for statewide rollups")
+    jurisdiction = StringField()
+    total_votes = IntField(required=True, help_text="Sum of raw_total_votes")
+    contest_total_votes = IntField(help_text="Votes for all candidates in the contest in the same jurisdiction")
+    rank = IntField(help_text="Candidate's place by votes in the contest in the same jurisdiction, starting at 1")
+    result_count = IntField(help_text="Number of Results summed")
+    updated = DateTimeField()
+
+    meta = {
+        'indexes': [
+            ['election_id', 'contest_slug', 'reporting_level', 'ocd_id'],
+            ['state', 'election_id'],
+        ],
+        'index_background': True,
+    }
+
+    def __unicode__(self):
+        return u'%s-%s-%s-%s (%s)' % (self.election_id, self.contest_slug,
+            self.candidate_slug, self.ocd_id, self.total_votes)
+
+
+class LoadLedger(Document):
+    """
+    Record of a source file loaded into Results, used to skip reloading
+    files that haven't changed since they were last loaded.
+
+    A file is considered current when both the hash of its contents and
+    the version of the loader that read it match the ledger entry.
+
+    """
+    source = StringField(required=True, unique=True, help_text="Standardized filename of the loaded file")
+    state = StringField(required=True, choices=STATE_POSTALS)
+    election_id = StringField(help_text="election id, e.g. md-2012-11-06-general")
+    content_hash = StringField(required=True, help_text="MD5 hex digest of the cached file")
+    loader_version = IntField(required=True, help_text="LoadResults.loader_version when the file was loaded")
+    row_count = IntField(help_text="Number of Results loaded from the file")
+    created = DateTimeField()
+    updated = DateTimeField()
+
+    def __unicode__(self):
+        return u'%s (%s)' % (self.source, self.content_hash)
+
+
+class ParsedName(Document):
+    """
+    Cached result of parsing a raw candidate name into its parts.
+
+    Ids are derived from the parser version and raw name, so a parser
+    upgrade leaves old entries unused rather than returning stale parts.
+
+    """
+    raw_name = StringField(required=True)
+    parser_version = StringField(required=True)
+    given_name = StringField()
+    family_name = StringField()
+    additional_name = StringField()
+    suffix = StringField()
+
+    def __unicode__(self):
+        return u'%s (%s)' % (self.raw_name, self.parser_version)
+
+    @classmethod
+    def make_id(cls, parser_version, raw_name):
+        return key_id((parser_version, raw_name))
+
+
+class TransformWatermark(Document):
+    """
+    Start time of the last successful run of an incremental transform
+    for a state.
+
+    The transform's next run only needs to process documents loaded or
+    reloaded since then.
+
+    """
+    state = StringField(required=True, choices=STATE_POSTALS)
+    transform = StringField(required=True)
+    watermark = DateTimeField(required=True)
+    updated = DateTimeField()
+
+    meta = {
+        'indexes': [
+            {'fields': ['state', 'transform'], 'unique': True},
+        ],
+    }
+
+    def __unicode__(self):
+        return u'%s %s (%s)' % (self.state, self.transform, self.watermark)
@@ -0,0 +1,171 @@
+from invoke import task
+
+from mongoengine.context_managers import switch_collection
+
+from openelex.base.tabular import to_int
+from openelex.base.partition import partition_names
+from openelex.models import (Candidate, Contest, LoadLedger, ParsedName,
+    Result, ResultRollup, TransformWatermark)
+
+MODELS = (Contest, Candidate, Result, ResultRollup, LoadLedger, ParsedName,
+    TransformWatermark)
+
+
+@task
+def ensure_indexes():
+    """
+    Build the indexes declared on each model's meta.
+
+    Indexes are built in the background, so loads and queries can keep
+    running against the collections while they're built. Indexes that
+    already exist are left as is.
+
+    Contest and Candidate indexes are only built here, not on first use.
+    Their unique natural key indexes can't be built while duplicates
+    remain, so run dedupe first on databases loaded before those keys
+    were unique, and run this before loading.
+    """
+    for doc_klass in MODELS:
+        if doc_klass is Result:
+            continue
+        print "Ensuring indexes for %s" % doc_klass._get_collection_name()
+        doc_klass.ensure_indexes()
+    for name in partition_names():
+        print "Ensuring indexes for %s" % name
+        with switch_collection(Result, name):
+            Result.ensure_indexes()
+
+
+@task
+def dedupe():
+    """
+    Merge duplicate Contests and Candidates.
+
+    Loads that ran before Contest and Candidate natural keys were unique
+    could store the same contest or candidate more than once. For each
+    natural key with several documents, the one with the id derived from
+    the key is kept, or else the oldest. Candidates and Results that
+    reference the others are repointed to it, raw parties of duplicate
+    Candidates are merged into it, and the others are deleted. Safe to
+    re-run.
+    """
+    _dedupe(Contest, ('election_id', 'slug'), 'contest')
+    # After Contests, so duplicate Candidates all reference the kept Contest
+    _dedupe(Candidate, ('election_id', 'contest_slug', 'slug'), 'candidate')
+
+
+def _duplicates(collection, key_fields):
+    "Natural keys shared by several documents, with the documents' ids"
+    pipeline = [
+        {'$group': {
+            '_id': dict((field, '$' + field) for field in key_fields),
+            'ids': {'$push': '$_id'},
+        }},
+        {'$match': {'ids.1': {'$exists': True}}},
+    ]
+    for group in collection.aggregate(pipeline, cursor={}, allowDiskUse=True):
+        yield tuple(group['_id'][field] for field in key_fields), group['ids']
+
+
+def _dedupe(doc_klass, key_fields, result_field):
+    collection = doc_klass._get_collection()
+    ref = Result._fields[result_field].db_field
+    merged = 0
+    for key, ids in _duplicates(collection, key_fields):
+        derived = doc_klass.make_id(*key)
+        keep = derived if derived in ids else min(ids)
+        dupes = [pk for pk in ids if pk != keep]
+        if doc_klass is Contest:
+            Candidate._get_collection().update({'contest': {'$in': dupes}},
+                {'$set': {'contest': keep}}, multi=True)
+        else:
+            parties = set()
+            for doc in collection.find({'_id': {'$in': dupes}},
+                                       fields=['raw_parties']):
+                parties.update(doc.get('raw_parties') or [])
+            if parties:
+                collection.update({'_id': keep}, {'$addToSet':
+                    {'raw_parties': {'$each': sorted(parties)}}})
+        # Straight from the database, so no Result indexes are built
+        for name in partition_names():
+            Result._get_db()[name].update({ref: {'$in': dupes}},
+                {'$set': {ref: keep}}, multi=True)
+        collection.remove({'_id': {'$in': dupes}})
+        merged += len(dupes)
+    print "Merged %s duplicate %s documents" % (merged,
+        doc_klass._get_collection_name())
+
+
+@task(help={
+    'batch_size': 'Number of documents updated per bulk operation (default 1000)',
+})
+def migrate_results(batch_size=1000):
+    """
+    Convert existing Results to the compact storage layout.
+
+    Result indexes are dropped, fields are renamed to their short db_field
+    names, string vote breakdowns are converted to integers, and the
+    indexes are then rebuilt on the new field names. Breakdowns that
+    aren't numbers are reported and left as they are. Safe to re-run.
+    """
+    for name in partition_names():
+        print "Migrating %s" % name
+        _migrate_results(name, int(batch_size))
+
+
+def _breakdown_ints(doc_id, vals):
+    "Vote breakdowns with numeric strings converted to integers"
+    ints = {}
+    for key, val in vals.items():
+        if isinstance(val, basestring):
+            try:
+                val = to_int(val)
+            except ValueError:
+                print "\tSkipping non-numeric %s breakdown %r of %s" % (key,
+                    val, doc_id)
+        ints[key] = val
+    return ints
+
+
+def _migrate_results(name, batch_size):
+    # Got straight from the database, since going through Result would
+    # build its indexes on the new field names before the rename, which
+    # would then have to maintain them
+    collection = Result._get_db()[name]
+    print "Dropping Result indexes"
+    collection.drop_indexes()
+
+    renames = dict((name, field.db_field)
+        for name, field in Result._fields.items()
+        if name != 'id' and name != field.db_field)
+    print "Renaming Result fields"
+    collection.update({}, {'$rename': renames}, multi=True)
+
+    breakdowns = Result._fields['raw_vote_breakdowns'].db_field
+    print "Converting vote breakdowns to integers"
+    count = 0
+    bulk = collection.initialize_unordered_bulk_op()
+    pending = 0
+    for doc in collection.find({breakdowns: {'$exists': True}},
+                               fields=[breakdowns]):
+        vals = doc[breakdowns]
+        if not any(isinstance(val, basestring) for val in vals.values()):
+            continue
+        ints = _breakdown_ints(doc['_id'], vals)
+        if ints == vals:
+            continue
+        bulk.find({'_id': doc['_id']}).update_one({'$set': {breakdowns: ints}})
+        pending += 1
+        if pending == batch_size:
+            bulk.execute()
+            count += pending
+            bulk = collection.initialize_unordered_bulk_op()
+            pending = 0
+    if pending:
+        bulk.execute()
+        count += pending
+    print "Converted %s Results" % count
+
+    print "Rebuilding Result indexes"
+    with switch_collection(Result, name):
+        Result.ensure_indexes()
@@ -1,24 +1,104 @@
 import os
+import sys
 
 from invoke import task
 
-from openelex.base.load import BaseLoader
+from openelex.base.load import (BaseLoader, LoadStats, StagedReload,
+    load_parallel)
+from openelex.base.partition import partition_name, result_partition
+from openelex.base.rollup import rollup_election, stale_elections
+from openelex.models import LoadLedger
 from .utils import load_module
 
 @task(help={
     'state':'Two-letter state-abbreviation, e.g. NY',
     'datefilter': 'Any portion of a YYYYMMDD date, e.g. YYYY, YYYYMM, etc.',
+    'workers': 'Number of processes used to load files in parallel (default 1)',
+    'force': 'Reload files even if unchanged since they were last loaded',
+    'staging': 'Reload all files for the matching elections into a staging collection, then swap it in (needs RESULT_PARTITIONING = \'state\')',
+    'dry_run': 'Parse files without touching MongoDB, and report throughput and timings for each file',
 })
-def run(state, datefilter=''):
+def run(state, datefilter='', workers=1, force=False, staging=False,
+        dry_run=False):
     """
     Load cached data files into MongoDB.
 
-    State is required. Optionally provide 'datefilter' to limit files that are loaded.
+    State is required. Optionally provide 'datefilter' to limit files that are loaded,
+    and 'workers' to load several files at once, largest files first.
+
+    Files whose contents and loader version match their last load are
+    skipped, unless 'force' is provided.
+
+    With 'staging', every file for the matched elections is reloaded into a
+    copy of the state's Result partition that replaces it only once loading
+    succeeds, so readers never see a partial load. Results must be
+    partitioned by state. Don't load the state elsewhere meanwhile.
+
+    With 'dry_run', every matching file is parsed and converted to documents
+    in a single process, without reading from or writing to MongoDB, and
+    rows/sec, process peak memory and time spent reading, transforming and
+    writing are reported for each file.
     """
+    if staging and partition_name(state) is None:
+        sys.exit("ERROR: --staging needs Results partitioned by state; set "
+            "RESULT_PARTITIONING = 'state' in settings.py")
+
     state_mod = load_module(state, ['datasource', 'load'])
     datasrc = state_mod.datasource.Datasource()
     loader = state_mod.load.LoadResults()
 
     #TODO: Notify user if there's a mismatch between expected files and cache.diff
-    for mapping in datasrc.mappings(datefilter):
-        loader.run(mapping)
+    mappings = datasrc.mappings(datefilter)
+    if dry_run:
+        loader.dry_run = True
+        for mapping in mappings:
+            loader.stats = LoadStats(mapping['generated_filename'])
+            loader.run(mapping)
+            print("DRY RUN: %s" % loader.stats.report())
+        return
+
+    with result_partition(state):
+        if staging:
+            with StagedReload([m['election'] for m in mappings]) as staged:
+                print("STAGING: %s" % staged.name)
+                _load(state_mod, mappings, int(workers), staged.name)
+            return
+
+        if not force:
+            to_load = []
+            for mapping in mappings:
+                if loader.is_loaded(mapping):
+                    print("SKIP (unchanged): %s" % mapping['generated_filename'])
+                else:
+                    to_load.append(mapping)
+            mappings = to_load
+        _load(state_mod, mappings, int(workers), partition_name(state))
+
+def _load(state_mod, mappings, workers, result_collection=None):
+    try:
+        load_parallel(state_mod.load.LoadResults, mappings, workers,
+            result_collection)
+    except RuntimeError as e:
+        sys.exit("ERROR: %s" % e)
+
+
+@task(help={
+    'state': 'Two-letter state-abbreviation, e.g. NY',
+    'force': 'Rebuild rollups for every loaded election, not just changed ones',
+})
+def rollup(state, force=False):
+    """
+    Rebuild precomputed contest totals (ResultRollups) from loaded Results.
+
+    Only elections with files loaded since their rollups were last built
+    are rebuilt, unless 'force' is provided.
+    """
+    if force:
+        election_ids = sorted(LoadLedger.objects.filter(
+            state=state.upper()).distinct('election_id'))
+    else:
+        election_ids = stale_elections(state)
+    with result_partition(state):
+        for election_id in election_ids:
+            count = rollup_election(election_id)
+            print("ROLLUP: %s (%s rollups)" % (election_id, count))
@@ -3,6 +3,7 @@ import sys
 
 from invoke import task
 
+from openelex.base.transform import run_transforms
 from .utils import load_module, split_args
 
 @task(help={
@@ -15,10 +16,13 @@ def list(state):
     """
     # Iniitialize transforms for the state in global registry
     state_mod = load_module(state, ['transform'])
-    transforms = state_mod.transform.registry.all(state)
+    plan = state_mod.transform.registry.plan(state)
     print "\n%s transforms, in order of execution:\n" % state.upper()
-    for key, func in transforms.items():
-        print '* %s' % key
+    for key, waits in plan.items():
+        if waits:
+            print '* %s (after %s)' % (key, ', '.join(sorted(waits)))
+        else:
+            print '* %s' % key
     print
 
 
@@ -26,32 +30,36 @@ def list(state):
     'state': 'Two-letter state-abbreviation, e.g. NY',
     'include': 'Transforms to run (comma-separated list)',
     'exclude': 'Transforms to skip (comma-separated list)',
+    'workers': 'Number of processes used to run independent transforms at once (default 1)',
+    'full': 'Reprocess every document, not just those loaded since the last run',
 })
-def run(state, include=None, exclude=None):
+def run(state, include=None, exclude=None, workers=1, full=False):
     """
     Run transformations on data loaded in MongoDB.
 
     State is required. Optionally provide to limit transforms that are performed.
+
+    Transforms run in dependency order. With 'workers', transforms that
+    don't read or write the same data run concurrently. The time taken by
+    each transform is reported once they've all finished.
+
+    Incremental transforms only process documents loaded since they last
+    ran for the state, unless 'full' is provided.
     """
     if include and exclude:
         sys.exit("ERROR: You can not use both include and exclude flags!")
 
     # Iniitialize transforms for the state in global registry
-    state_mod = load_module(state, ['transform'])
-    transforms = state_mod.transform.registry.all(state)
-
-    # Filter transformations  based in include/exclude flags
-    if include:
-        to_run = split_args(include)
-        for trx in transforms:
-            if trx not in to_run:
-                transforms.pop(trx)
-    if exclude:
-        to_skip = split_args(exclude)
-        for trx in transforms:
-            if trx in to_skip:
-                transforms.pop(trx)
-
-    for name, func in transforms.items():
-        print 'Executing %s' % name
-        func()
+    load_module(state, ['transform'])
+    try:
+        timings = run_transforms(state,
+            include=split_args(include) if include else None,
+            exclude=split_args(exclude) if exclude else None,
+            workers=int(workers), full=full)
+    except RuntimeError as e:
+        sys.exit("ERROR: %s" % e)
+
+    print "\nTransform timings:\n"
+    for name, elapsed in timings.items():
+        print '* %s: %.2fs' % (name, elapsed)
+    print
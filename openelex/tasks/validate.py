@@ -4,6 +4,7 @@ from collections import OrderedDict
 
 from invoke import task
 
+from openelex.base.partition import result_partition
 from .utils import load_module, split_args
 
 
@@ -35,6 +36,7 @@ def run(state, include=None, exclude=None):
     Run data validations for state.
 
     State is required. Optionally filter validations using include/exclude flags.
+    Validations query the state's Result partition, if Results are partitioned.
     """
     if include and exclude:
         sys.exit("ERROR: You can not use both include and exclude flags!")
@@ -63,12 +65,13 @@ def run(state, include=None, exclude=None):
     passed = []
     failed = []
     print
-    for val, func in validations.items():
-        try:
-            func()
-            passed.append(name)
-        except Exception as e:
-            failed.append("Error: %s - %s - %s" % (state.upper(), name, e))
+    with result_partition(state):
+        for val, func in validations.items():
+            try:
+                func()
+                passed.append(name)
+            except Exception as e:
+                failed.append("Error: %s - %s - %s" % (state.upper(), name, e))
 
     print "\n\nVALIDATION RESULTS"
     print "Passed: %s" % len(passed)
@@ -0,0 +1,519 @@
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+import datetime
+
+from bson import ObjectId
+from mock import Mock, patch
+from mongoengine import Document, ReferenceField, StringField, ValidationError
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from openelex.base import load
+from openelex.base.load import (BaseLoader, BulkInserter, ElectionContext,
+    LoadStats, RunContext, StagedReload, load_parallel)
+from openelex.base.tabular import Column, TabularSpec, to_int
+from openelex.models import Candidate, Contest, LoadLedger, Result
+
+
+class Parent(Document):
+    name = StringField()
+
+
+class Child(Document):
+    parent = ReferenceField(Parent, required=True)
+    name = StringField(db_field='n', required=True)
+
+
+class RecordingLoader(object):
+    "Stands in for a state's LoadResults in load_parallel tests"
+    loaded = []
+
+    def run(self, mapping):
+        if mapping['generated_filename'] == 'bad.csv':
+            raise ValueError("bad row")
+        self.loaded.append(mapping['generated_filename'])
+
+
+class FakePool(object):
+    "Runs load_parallel's jobs in this process, in the order given"
+
+    def __init__(self, processes, initializer, initargs):
+        self.processes = processes
+        initializer(*initargs)
+
+    def imap_unordered(self, func, jobs):
+        return [func(job) for job in jobs]
+
+    def close(self):
+        pass
+
+    def terminate(self):
+        pass
+
+    def join(self):
+        pass
+
+
+class TestBulkInserter(TestCase):
+
+    def setUp(self):
+        patcher = patch.object(Child, '_get_collection')
+        self.collection = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.parent = Parent(id=ObjectId(), name='p')
+        self.inserter = BulkInserter(Child, batch_size=2)
+
+    def test_to_mongo(self):
+        "raw documents use db field names and reference ids, and skip None"
+        doc = self.inserter.to_mongo({'parent': self.parent, 'name': 'a',
+            'extra': None})
+        self.assertEqual({'parent': self.parent.pk, 'n': 'a'}, doc)
+
+    def test_undeclared_field(self):
+        "fields missing from a fixed schema are rejected"
+        self.assertRaises(ValidationError, self.inserter.to_mongo,
+            {'parent': self.parent, 'nmae': 'a'})
+
+    def test_flushes_full_batches(self):
+        "documents are inserted as soon as a batch fills up"
+        self.inserter.extend([{'parent': self.parent, 'name': n}
+            for n in 'abc'])
+        self.collection.insert.assert_called_once_with([
+            {'parent': self.parent.pk, 'n': 'a'},
+            {'parent': self.parent.pk, 'n': 'b'},
+        ], continue_on_error=True)
+        self.assertEqual(1, len(self.inserter.buffer))
+        self.assertEqual(2, self.inserter.count)
+
+    def test_flush_remainder(self):
+        "flush writes any partial batch and is a no-op when empty"
+        self.inserter.add({'parent': self.parent, 'name': 'a'})
+        self.inserter.flush()
+        self.inserter.flush()
+        self.assertEqual(1, self.collection.insert.call_count)
+        self.assertEqual(1, self.inserter.count)
+        self.assertEqual([], self.inserter.buffer)
+
+    def test_sampled_validation(self):
+        "every validate_every-th document is validated against the schema"
+        inserter = BulkInserter(Child, validate_every=2)
+        self.assertRaises(ValidationError, inserter.add, {'name': 'a'})
+        inserter.add({'parent': self.parent, 'name': 'b'})
+        # Not sampled, so not validated
+        inserter.add({'name': 'c'})
+        self.assertRaises(ValidationError, inserter.add, {'name': 'd'})
+
+
+class TestLoadLedger(TestCase):
+
+    def setUp(self):
+        self.loader = BaseLoader()
+        self.mapping = {'generated_filename': '20121106__md__general.csv'}
+        patcher = patch.object(BaseLoader, 'content_hash')
+        patcher.start().return_value = 'abc'
+        self.addCleanup(patcher.stop)
+
+    @patch.object(LoadLedger, 'objects')
+    def test_is_loaded(self, mock_objects):
+        "files are current only if hash and loader version both match"
+        entry = LoadLedger(content_hash='abc', loader_version=1)
+        mock_objects.get.return_value = entry
+        self.assertTrue(self.loader.is_loaded(self.mapping))
+        entry.loader_version = 0
+        self.assertFalse(self.loader.is_loaded(self.mapping))
+        entry.loader_version = 1
+        entry.content_hash = 'def'
+        self.assertFalse(self.loader.is_loaded(self.mapping))
+
+    @patch.object(LoadLedger, 'objects')
+    def test_not_in_ledger(self, mock_objects):
+        mock_objects.get.side_effect = LoadLedger.DoesNotExist
+        self.assertFalse(self.loader.is_loaded(self.mapping))
+
+    @patch.object(Result, 'objects')
+    @patch.object(LoadLedger, 'objects')
+    def test_clear_results(self, mock_objects, mock_results):
+        "a file's ledger entry is removed before its Results"
+        calls = []
+        mock_objects.return_value.delete.side_effect = (
+            lambda: calls.append('ledger'))
+        results = mock_results.filter.return_value
+        results.count.return_value = 2
+        results.delete.side_effect = lambda: calls.append('results')
+        self.loader.clear_results('20121106__md__general.csv')
+        mock_objects.assert_called_once_with(
+            source='20121106__md__general.csv')
+        self.assertEqual(['ledger', 'results'], calls)
+
+
+class TestContentHash(TestCase):
+
+    def setUp(self):
+        self.tmpdir = mkdtemp()
+        self.addCleanup(rmtree, self.tmpdir)
+        self.loader = BaseLoader()
+        self.loader.cache = Mock(abspath=self.tmpdir)
+        self.mapping = {'generated_filename': 'source.csv'}
+        with open(join(self.tmpdir, 'source.csv'), 'wb') as f:
+            f.write('a,b\n')
+
+    def test_hashed_once(self):
+        "a mapping's file is only read the first time it's hashed"
+        digest = self.loader.content_hash(self.mapping)
+        self.assertEqual('f69f5b72bc79a92dc70c63c9aa142e36', digest)
+        self.assertEqual(digest, self.mapping['content_hash'])
+        with patch('openelex.base.load.open', create=True) as mock_open:
+            self.assertEqual(digest, self.loader.content_hash(self.mapping))
+            self.assertFalse(mock_open.called)
+
+
+class TestStagedReload(TestCase):
+
+    def setUp(self):
+        patcher = patch.object(Result, '_get_collection')
+        self.collection = patcher.start().return_value
+        self.collection.name = 'result_md'
+        self.collection.count.return_value = 10
+        self.addCleanup(patcher.stop)
+        patcher = patch.object(LoadLedger, 'objects')
+        self.ledger = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.object(load, 'is_partitioned')
+        patcher.start().return_value = True
+        self.addCleanup(patcher.stop)
+
+    def test_swap(self):
+        "a partition is seeded with other elections and renamed over"
+        with StagedReload(['md-2012-11-06-general']):
+            self.assertEqual('result_md_staging',
+                Result._get_collection_name())
+        self.assertEqual('result', Result._get_collection_name())
+        self.collection.aggregate.assert_called_once_with([
+            {'$match': {'eid': {'$nin': ['md-2012-11-06-general']}}},
+            {'$out': 'result_md_staging'},
+        ])
+        self.collection.create_index.assert_any_call([('src', 1)],
+            background=False)
+        self.collection.rename.assert_called_once_with('result_md',
+            dropTarget=True)
+        self.assertFalse(self.ledger.called)
+
+    def test_concurrent_writes(self):
+        "the swap is abandoned if the partition changed while staging"
+        self.collection.count.side_effect = [10, 11]
+        def reload():
+            with StagedReload(['md-2012-11-06-general']):
+                pass
+        self.assertRaises(RuntimeError, reload)
+        self.collection.drop.assert_called_once_with()
+        self.assertFalse(self.collection.rename.called)
+        self.ledger.assert_called_once_with(
+            election_id__in=['md-2012-11-06-general'])
+        self.ledger.return_value.delete.assert_called_once_with()
+
+    def test_unpartitioned(self):
+        "the shared result collection can't be staged"
+        self.collection.name = 'result'
+        self.assertRaises(ValueError, StagedReload, ['md-2012-11-06-general'])
+        self.assertFalse(self.collection.database.drop_collection.called)
+
+    def test_no_indexes_while_loading(self):
+        "indexes are only built on staging once it's loaded"
+        with StagedReload(['md-2012-11-06-general']):
+            self.assertFalse(Result._meta['auto_create_index'])
+            self.assertFalse(self.collection.create_index.called)
+        self.assertTrue(Result._meta.get('auto_create_index', True))
+        self.assertTrue(self.collection.create_index.called)
+
+    def test_failed_load(self):
+        "staging is dropped and live results untouched if loading fails"
+        try:
+            with StagedReload(['md-2012-11-06-general']):
+                raise ValueError
+        except ValueError:
+            pass
+        self.collection.drop.assert_called_once_with()
+        self.assertFalse(self.collection.rename.called)
+        # So the files are reloaded next time, rather than skipped
+        self.ledger.assert_called_once_with(
+            election_id__in=['md-2012-11-06-general'])
+        self.ledger.return_value.delete.assert_called_once_with()
+
+
+class TestRunContext(TestCase):
+
+    def setUp(self):
+        self.datasource = Mock()
+        self.datasource.elections.return_value = {2012: [
+            {'slug': 'md-2012-04-03-primary'},
+            {'slug': 'md-2012-11-06-general'},
+        ]}
+        self.run_context = RunContext(self.datasource)
+
+    def test_election(self):
+        "election metadata is fetched from the datasource once per election"
+        for i in range(2):
+            elec = self.run_context.election('md-2012-11-06-general')
+        self.assertEqual({'slug': 'md-2012-11-06-general'}, elec)
+        self.datasource.elections.assert_called_once_with(2012)
+
+    @patch.object(Contest, 'objects')
+    def test_lookup(self, mock_objects):
+        "lookups are shared across files and never read from Mongo"
+        lkup = self.run_context.lookup(Contest, 'md-2012-11-06-general')
+        self.assertEqual({}, lkup)
+        self.assertTrue(lkup is
+            self.run_context.lookup(Contest, 'md-2012-11-06-general'))
+        self.assertFalse(mock_objects.filter.called)
+
+
+class TestUpsert(TestCase):
+
+    def setUp(self):
+        self.loader = BaseLoader()
+        patcher = patch.object(Contest, '_get_collection')
+        self.collection = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.contest = Contest(election_id='md-2012-11-06-general',
+            slug='us-senate', source='source.csv', state='MD',
+            start_date=datetime.datetime(2012, 11, 6),
+            end_date=datetime.datetime(2012, 11, 6), result_type='certified',
+            raw_office='U.S. Senator')
+
+    def test_upsert_by_key_id(self):
+        "new objects are inserted under an id derived from their natural key"
+        contest = self.loader.upsert(self.contest)
+        pk = Contest.make_id('md-2012-11-06-general', 'us-senate')
+        self.assertEqual(pk, contest.pk)
+        spec, update = self.collection.update.call_args[0]
+        self.assertEqual({'_id': pk}, spec)
+        self.assertEqual('us-senate', update['$setOnInsert']['slug'])
+        self.assertFalse('_id' in update['$setOnInsert'])
+
+    def test_dry_run(self):
+        "dry runs derive ids without touching Mongo"
+        self.loader.dry_run = True
+        contest = self.loader.upsert(self.contest)
+        self.assertEqual(Contest.make_id('md-2012-11-06-general', 'us-senate'),
+            contest.pk)
+        self.assertFalse(self.collection.update.called)
+
+    def test_upsert_legacy_id(self):
+        "objects saved with random ids are matched on the natural key"
+        legacy_id = ObjectId()
+        self.collection.update.side_effect = DuplicateKeyError('E11000')
+        self.collection.find_one.return_value = {'_id': legacy_id}
+        contest = self.loader.upsert(self.contest)
+        self.assertEqual(legacy_id, contest.pk)
+        self.collection.find_one.assert_called_once_with(
+            {'election_id': 'md-2012-11-06-general', 'slug': 'us-senate'},
+            fields=['_id'])
+
+    def test_upsert_bumps_updated(self):
+        "existing objects only have their updated timestamp changed, to now"
+        created = datetime.datetime(2014, 1, 1)
+        self.contest.created = self.contest.updated = created
+        before = datetime.datetime.now()
+        self.loader.upsert(self.contest)
+        spec, update = self.collection.update.call_args[0]
+        self.assertEqual(['updated'], update['$set'].keys())
+        self.assertTrue(update['$set']['updated'] >= before)
+        self.assertEqual(created, update['$setOnInsert']['created'])
+        self.assertFalse('updated' in update['$setOnInsert'])
+
+    def test_bulk_upsert(self):
+        "queued objects are upserted in one op, remapping legacy ids"
+        legacy_id = ObjectId()
+        bulk = self.collection.initialize_unordered_bulk_op.return_value
+        bulk.execute.side_effect = BulkWriteError({'writeErrors': [
+            {'index': 0, 'code': 11000, 'errmsg': 'E11000'}]})
+        self.collection.find_one.return_value = {'_id': legacy_id}
+        contest = self.loader.queue_upsert(self.contest)
+        pk = contest.pk
+        self.assertEqual({pk: legacy_id}, self.loader.flush_upserts())
+        self.assertEqual(legacy_id, contest.pk)
+        bulk.find.assert_called_once_with({'_id': pk})
+        self.assertEqual([], self.loader._pending_upserts)
+
+    def test_results_remapped(self):
+        "buffered results are pointed at remapped ids before being written"
+        old_id, legacy_id = ObjectId(), ObjectId()
+        with patch.object(Child, '_get_collection') as mock_collection:
+            inserter = BulkInserter(Child,
+                before_flush=lambda: {old_id: legacy_id})
+            inserter.add({'parent': Parent(id=old_id), 'name': 'a'})
+            inserter.flush()
+            mock_collection.return_value.insert.assert_called_once_with(
+                [{'parent': legacy_id, 'n': 'a'}], continue_on_error=True)
+
+
+class TestElectionContext(TestCase):
+
+    def build(self, election_id):
+        elec_meta = {
+            'start_date': '2012-04-03',
+            'end_date': '2012-04-03',
+            'race_type': 'primary',
+            'result_type': 'certified',
+            'special': False,
+        }
+        return ElectionContext.build(election_id, 'source.csv', 'md',
+            elec_meta)
+
+    def test_build(self):
+        ctx = self.build('md-2012-04-03-primary')
+        self.assertEqual('MD', ctx.state)
+        self.assertEqual(datetime.datetime(2012, 4, 3), ctx.start_date)
+        self.assertTrue(ctx.primary)
+
+    def test_contest_slug(self):
+        "party is only added to slugs for primaries, district not for pres"
+        primary = self.build('md-2012-04-03-primary')
+        general = self.build('md-2012-11-06-general')
+        self.assertEqual('us-congress-3-dem',
+            primary.contest_slug('U.S. Congress', '3', 'DEM'))
+        self.assertEqual('us-congress-3',
+            general.contest_slug('U.S. Congress', '3', 'DEM'))
+        self.assertEqual('president-vice-pres',
+            general.contest_slug('President - Vice Pres', '1', 'DEM'))
+
+    def test_slugs_memoized(self):
+        ctx = self.build('md-2012-11-06-general')
+        with patch('openelex.base.load.slugify') as mock_slugify:
+            mock_slugify.return_value = 'barack-obama'
+            ctx.candidate_slug('Barack Obama')
+            self.assertEqual('barack-obama', ctx.candidate_slug('Barack Obama'))
+            self.assertEqual(1, mock_slugify.call_count)
+
+
+class TestLoadTabular(TestCase):
+
+    spec = TabularSpec(
+        office=Column('office'),
+        district=Column('district'),
+        party=Column('party'),
+        candidate=(Column('first'), Column('last')),
+        votes=Column('votes', to_int),
+        result_fields={'raw_jurisdiction': Column('county')},
+        offices=set([u'U.S. Senate']),
+    )
+    rows = [
+        [u'office', u'district', u'party', u'first', u'last', u'county', u'votes'],
+        [u'U.S. Senate', u'', u'DEM', u'Ben', u'Cardin', u'Allegany', u'1,000'],
+        [u'U.S. Senate', u'', u'DEM', u'Ben', u'Cardin', u'Anne Arundel', u''],
+        [u'Judge', u'', u'DEM', u'Jane', u'Doe', u'Allegany', u'5'],
+    ]
+
+    def setUp(self):
+        self.loader = BaseLoader()
+        self.loader.run_context = RunContext(Mock())
+        self.ctx = ElectionContext.build('md-2012-11-06-general', 'source.csv',
+            'md', {'start_date': '2012-11-06', 'end_date': '2012-11-06',
+            'race_type': 'general', 'result_type': 'certified',
+            'special': False})
+        for klass in (Result, Candidate):
+            patcher = patch.object(klass, '_get_collection')
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch.object(BaseLoader, 'bulk_upsert')
+        self.bulk_upsert = patcher.start()
+        self.bulk_upsert.return_value = {}
+        self.addCleanup(patcher.stop)
+
+    def test_load(self):
+        "rows are converted to results, upserting each contest/candidate once"
+        count = self.loader.load_tabular({'generated_filename': 'source.csv'},
+            self.spec, self.ctx, rows=self.rows)
+        self.assertEqual(2, count)
+        (contests,), (candidates,) = [args for args, kwargs in
+            self.bulk_upsert.call_args_list]
+        self.assertEqual(['us-senate'], [obj.slug for obj in contests])
+        self.assertEqual(['ben-cardin'], [obj.slug for obj in candidates])
+        docs = Result._get_collection().insert.call_args[0][0]
+        self.assertEqual([1000, 0], [doc['r_votes'] for doc in docs])
+        self.assertEqual(Candidate.make_id('md-2012-11-06-general', 'us-senate',
+            'ben-cardin'), docs[0]['cand'])
+        self.assertEqual(u'Anne Arundel', docs[1]['r_jur'])
+        self.assertEqual('county', docs[1]['lvl'])
+        # Stamped when written, not when the load started
+        self.assertEqual(docs[0]['upd'], docs[1]['upd'])
+        self.assertTrue(docs[0]['upd'] >= self.ctx.timestamp)
+
+    def test_dry_run(self):
+        "dry runs build every document but write nothing, and collect stats"
+        self.loader.dry_run = True
+        self.loader.stats = LoadStats('source.csv')
+        count = self.loader.load_tabular({'generated_filename': 'source.csv'},
+            self.spec, self.ctx, rows=self.rows)
+        self.assertEqual(2, count)
+        self.assertFalse(Result._get_collection().insert.called)
+        self.assertEqual(4, self.loader.stats.rows)
+        self.assertTrue(self.loader.stats.report().startswith(
+            'source.csv: 4 rows in '))
+
+    @patch('openelex.base.load.peak_rss')
+    def test_stats_peak_rss(self, peak_rss):
+        "memory is reported as the process peak and its rise during a file"
+        peak_rss.return_value = 100.0
+        stats = LoadStats('source.csv')
+        peak_rss.return_value = 150.0
+        self.assertTrue('process peak RSS 150.0 MB (+50.0 MB during file)'
+            in stats.report())
+
+    def test_missing_column(self):
+        "required columns missing from a file raise a KeyError"
+        self.assertRaises(KeyError, self.spec.compile, [u'office'],
+            {'generated_filename': 'source.csv'})
+
+
+class TestLoadParallel(TestCase):
+
+    def setUp(self):
+        self.tmpdir = mkdtemp()
+        self.addCleanup(rmtree, self.tmpdir)
+        RecordingLoader.loaded = []
+        for name, size in (('small.csv', 1), ('large.csv', 100),
+                ('medium.csv', 10)):
+            with open(join(self.tmpdir, name), 'wb') as f:
+                f.write('x' * size)
+        self.mappings = [{'generated_filename': name} for name in
+            ('small.csv', 'missing.csv', 'large.csv', 'medium.csv')]
+        for name, target in (
+                ('StateCache', Mock(return_value=Mock(abspath=self.tmpdir))),
+                ('Pool', FakePool)):
+            patcher = patch.object(load, name, target)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @patch.object(load, 'reset_connections')
+    def test_largest_first(self, reset_connections):
+        "files are loaded largest first, each worker with its own connection"
+        load_parallel(RecordingLoader, self.mappings, 2)
+        self.assertEqual(['large.csv', 'medium.csv', 'small.csv',
+            'missing.csv'], RecordingLoader.loaded)
+        reset_connections.assert_called_once_with()
+
+    @patch.object(load, 'reset_connections')
+    def test_errors_collected(self, reset_connections):
+        "a failed file doesn't stop the others, and all failures are raised"
+        self.mappings.insert(0, {'generated_filename': 'bad.csv'})
+        for workers in (1, 2):
+            RecordingLoader.loaded = []
+            try:
+                load_parallel(RecordingLoader, self.mappings, workers)
+            except RuntimeError as e:
+                self.assertTrue('1 of 5 files failed' in str(e))
+                self.assertTrue('bad.csv' in str(e))
+                self.assertTrue('ValueError: bad row' in str(e))
+            else:
+                self.fail("RuntimeError not raised")
+            self.assertEqual(4, len(RecordingLoader.loaded))
+
+    def test_single_worker(self):
+        "with one worker, files are loaded in order in this process"
+        with patch.object(load, 'Pool') as pool:
+            load_parallel(RecordingLoader, self.mappings, 1)
+            self.assertFalse(pool.called)
+        self.assertEqual(['small.csv', 'missing.csv', 'large.csv',
+            'medium.csv'], RecordingLoader.loaded)
@@ -0,0 +1,69 @@
+from unittest import TestCase
+
+from mock import patch
+
+from openelex.base.names import NameParseCache, parse_name
+from openelex.models import ParsedName
+
+
+class TestNameParseCache(TestCase):
+
+    def test_parse_name(self):
+        parts = parse_name(u'John Q. Public Jr.')
+        self.assertEqual(u'John', parts['given_name'])
+        self.assertEqual(u'Public', parts['family_name'])
+        self.assertEqual(u'Q.', parts['additional_name'])
+        self.assertEqual(u'Jr.', parts['suffix'])
+
+    def test_lru_eviction(self):
+        cache = NameParseCache(max_size=2, persist=False)
+        cache.parse(u'Barack Obama')
+        cache.parse(u'Mitt Romney')
+        cache.parse(u'Barack Obama')
+        cache.parse(u'Jill Stein')
+        self.assertEqual([u'Barack Obama', u'Jill Stein'],
+            list(cache._cache.keys()))
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(3, cache.misses)
+
+    @patch.object(ParsedName, '_get_collection')
+    def test_prefetch_and_flush(self, mock_collection):
+        "stored names are fetched in one query and new ones upserted in bulk"
+        collection = mock_collection.return_value
+        stored_id = ParsedName.make_id('v1', u'Barack Obama')
+        collection.find.return_value = [{'_id': stored_id,
+            'given_name': u'Stored', 'family_name': u'Name',
+            'additional_name': u'', 'suffix': u''}]
+        cache = NameParseCache(parser_version='v1')
+        cache.prefetch([u'Barack Obama', u'Mitt Romney', u'Barack Obama'])
+        self.assertEqual(1, collection.find.call_count)
+        self.assertEqual(u'Stored', cache.parse(u'Barack Obama')['given_name'])
+        self.assertEqual(u'Mitt', cache.parse(u'Mitt Romney')['given_name'])
+        # Prefetched names aren't looked up again one at a time
+        self.assertFalse(collection.find_one.called)
+
+        bulk = collection.initialize_unordered_bulk_op.return_value
+        cache.flush()
+        bulk.find.assert_called_once_with(
+            {'_id': ParsedName.make_id('v1', u'Mitt Romney')})
+        update = bulk.find.return_value.upsert.return_value.update_one
+        doc = update.call_args[0][0]['$setOnInsert']
+        self.assertEqual(u'Romney', doc['family_name'])
+        self.assertEqual('v1', doc['parser_version'])
+        self.assertEqual(1, bulk.execute.call_count)
+        cache.flush()
+        self.assertEqual(1, bulk.execute.call_count)
+
+    @patch.object(ParsedName, '_get_collection')
+    def test_absent_names_bounded(self, mock_collection):
+        "names missing from Mongo are only remembered for one prefetch"
+        mock_collection.return_value.find.return_value = []
+        cache = NameParseCache(parser_version='v1')
+        cache.prefetch([u'Barack Obama', u'Mitt Romney'])
+        self.assertEqual(set([u'Barack Obama', u'Mitt Romney']),
+            cache._absent)
+        cache.prefetch([u'Jill Stein'])
+        self.assertEqual(set([u'Jill Stein']), cache._absent)
+        cache.parse(u'Jill Stein')
+        cache.flush()
+        self.assertEqual(set(), cache._absent)
@@ -0,0 +1,68 @@
+from unittest import TestCase
+
+from mock import Mock, patch
+
+from openelex import settings
+from openelex.base.partition import (delete_with_results, partition_name,
+    partition_names, result_partition, result_querysets)
+from openelex.models import Contest, Result
+
+
+class TestPartitioning(TestCase):
+
+    def setUp(self):
+        for target in ('_get_collection', '_get_db'):
+            patcher = patch.object(Result, target)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        Result._get_db.return_value.collection_names.return_value = [
+            'result', 'result_md', 'result_md_staging', 'result_wv',
+            'resultrollup']
+
+    def partition(self, scheme):
+        patcher = patch.object(settings, 'RESULT_PARTITIONING', scheme,
+            create=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_unpartitioned(self):
+        self.partition(None)
+        self.assertEqual(None, partition_name('md'))
+        self.assertEqual(['result'], partition_names())
+        with result_partition('md'):
+            self.assertEqual('result', Result._get_collection_name())
+
+    def test_by_state(self):
+        "Results are routed to a collection per state"
+        self.partition('state')
+        self.assertEqual('result_md', partition_name('MD'))
+        self.assertEqual(['result_md', 'result_wv'], partition_names())
+        with result_partition('md'):
+            self.assertEqual('result_md', Result._get_collection_name())
+        self.assertEqual('result', Result._get_collection_name())
+
+    @patch.object(Result, 'objects')
+    def test_fan_out(self, mock_objects):
+        "queries span every partition unless filtered by state"
+        self.partition('state')
+        self.assertEqual(2, len(result_querysets(contest_slug='us-senate')))
+        self.assertEqual(1, len(result_querysets(state='MD')))
+
+    @patch('openelex.base.partition.result_querysets')
+    @patch.object(Contest, 'objects')
+    def test_delete_with_results(self, mock_objects, result_querysets):
+        "deleted contests have their Results removed from every partition"
+        contests = mock_objects.filter.return_value
+        contests.scalar.return_value = ['md-1', 'md-2']
+        contests.count.return_value = 2
+        partitions = [Mock(), Mock()]
+        result_querysets.return_value = partitions
+        self.assertEqual(2, delete_with_results(Contest, state='MD',
+            election_id='md-2012-11-06-general'))
+        mock_objects.filter.assert_called_once_with(state='MD',
+            election_id='md-2012-11-06-general')
+        result_querysets.assert_called_once_with(
+            contest__in=['md-1', 'md-2'], state='MD')
+        for qs in partitions:
+            qs.delete.assert_called_once_with()
+        contests.delete.assert_called_once_with()
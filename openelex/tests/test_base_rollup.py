@@ -0,0 +1,106 @@
+from unittest import TestCase
+import datetime
+
+from mock import patch
+
+from openelex.base.rollup import (division_ocd_id, rollup_election,
+    stale_elections)
+from openelex.models import LoadLedger, Result, ResultRollup
+
+
+ALLEGANY = 'ocd-division/country:us/state:md/county:allegany'
+
+
+def group(contest, candidate, votes, ocd_id=None, level='county',
+          jurisdiction='Allegany', statewide=False):
+    _id = {
+        'contest_slug': contest,
+        'reporting_level': level,
+        'candidate_slug': candidate,
+    }
+    if not statewide:
+        _id['ocd_id'] = ocd_id
+    return {'_id': _id, 'total_votes': votes, 'result_count': 1,
+        'state': 'MD', 'jurisdiction': jurisdiction}
+
+
+class TestRollupElection(TestCase):
+
+    def setUp(self):
+        for klass in (Result, ResultRollup):
+            patcher = patch.object(klass, '_get_collection')
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch.object(ResultRollup, 'objects')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_rollup(self):
+        "groups are ranked within their contest and jurisdiction"
+        Result._get_collection().aggregate.side_effect = [
+            [
+                group('us-senate', 'ben-cardin', 10, ALLEGANY),
+                group('us-senate', 'dan-bongino', 30, ALLEGANY),
+                group('us-senate', 'rob-sobhani', 10, ALLEGANY),
+            ],
+            [group('us-senate', 'ben-cardin', 100, statewide=True)],
+        ]
+        self.assertEqual(4, rollup_election('md-2012-11-06-general'))
+        docs = ResultRollup._get_collection().insert.call_args[0][0]
+        self.assertEqual([(1, 50), (2, 50), (2, 50), (1, 100)],
+            [(doc['rank'], doc['contest_total_votes']) for doc in docs])
+        self.assertEqual('ocd-division/country:us/state:md', docs[3]['ocd_id'])
+        self.assertTrue(docs[3]['statewide'])
+        ResultRollup.objects.filter.assert_called_once_with(
+            election_id='md-2012-11-06-general')
+
+    def test_precincts(self):
+        "precinct results roll up to their county, skipping missing OCD ids"
+        precinct = ALLEGANY + '/precinct:%s'
+        Result._get_collection().aggregate.side_effect = [
+            [
+                group('us-senate', 'ben-cardin', None, None, 'precinct'),
+                group('us-senate', 'ben-cardin', 10, precinct % '01-001',
+                    'precinct', 'Allegany 01-001'),
+                group('us-senate', 'dan-bongino', 30, precinct % '01-001',
+                    'precinct', 'Allegany 01-001'),
+                group('us-senate', 'ben-cardin', 25, precinct % '01-002',
+                    'precinct', 'Allegany 01-002'),
+                group('us-senate', 'dan-bongino', 1, precinct % '01-002',
+                    'precinct', 'Allegany 01-002'),
+            ],
+            [],
+        ]
+        self.assertEqual(2, rollup_election('md-2012-11-06-general'))
+        docs = ResultRollup._get_collection().insert.call_args[0][0]
+        self.assertEqual([('ben-cardin', 35, 2, 1), ('dan-bongino', 31, 2, 2)],
+            [(doc['candidate_slug'], doc['total_votes'], doc['result_count'],
+            doc['rank']) for doc in docs])
+        self.assertEqual([ALLEGANY] * 2, [doc['ocd_id'] for doc in docs])
+        self.assertEqual(['precinct'] * 2,
+            [doc['reporting_level'] for doc in docs])
+        self.assertEqual(66, docs[0]['contest_total_votes'])
+        self.assertFalse('jurisdiction' in docs[0])
+
+    def test_division_ocd_id(self):
+        self.assertEqual(ALLEGANY, division_ocd_id(ALLEGANY + '/precinct:1'))
+        self.assertEqual(ALLEGANY, division_ocd_id(ALLEGANY))
+        sldl = 'ocd-division/country:us/state:md/sldl:1a'
+        self.assertEqual(sldl, division_ocd_id(sldl))
+
+
+class TestStaleElections(TestCase):
+
+    @patch.object(ResultRollup, 'objects')
+    @patch.object(LoadLedger, 'objects')
+    def test_stale(self, ledger_objects, rollup_objects):
+        "elections are stale if loaded after their rollups were built"
+        now = datetime.datetime.now()
+        hour = datetime.timedelta(hours=1)
+        ledger_objects.filter.return_value.only.return_value = [
+            LoadLedger(election_id='md-2012-11-06-general', updated=now),
+            LoadLedger(election_id='md-2012-04-03-primary', updated=now - hour),
+        ]
+        rollup = ResultRollup(updated=now - hour)
+        rollup_objects.filter.return_value.only.return_value.first.return_value = rollup
+        self.assertEqual(['md-2012-11-06-general'], stale_elections('md'))
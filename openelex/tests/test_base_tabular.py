@@ -0,0 +1,61 @@
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from mock import Mock, call, patch
+from openpyxl import Workbook
+
+from openelex.base.tabular import cell_text, tabular_file_rows
+
+
+class TestSpreadsheetRows(TestCase):
+
+    def setUp(self):
+        self.tmpdir = mkdtemp()
+        self.addCleanup(rmtree, self.tmpdir)
+
+    def test_cell_text(self):
+        "cells are read as unicode, like CSV fields"
+        self.assertEqual(u'', cell_text(None))
+        self.assertEqual(u'1204', cell_text(1204.0))
+        self.assertEqual(u'0.5', cell_text(0.5))
+        self.assertEqual(u'Allen', cell_text(u'Allen'))
+
+    def test_xlsx(self):
+        "rows are read across sheets, dropping repeated headers"
+        workbook = Workbook()
+        first = workbook.active
+        second = workbook.create_sheet()
+        for sheet, county in ((first, u'Adams'), (second, u'Allen')):
+            sheet.append([u'County Name', u'Votes'])
+            sheet.append([county, 10])
+        path = join(self.tmpdir, '20121106__oh__general__precincts.xlsx')
+        workbook.save(path)
+        self.assertEqual([
+            [u'County Name', u'Votes'],
+            [u'Adams', u'10'],
+            [u'Allen', u'10'],
+        ], list(tabular_file_rows(path)))
+
+    @patch('xlrd.open_workbook')
+    def test_xls(self, open_workbook):
+        "sheets are read one at a time, dropping repeated headers"
+        sheets = {}
+        for name, county in ((u'Sheet1', u'Ada'), (u'Sheet2', u'Adams')):
+            rows = [[u'County', u'Votes'], [county, 10.0]]
+            sheets[name] = Mock(nrows=len(rows))
+            sheets[name].row_values.side_effect = rows.__getitem__
+        book = open_workbook.return_value
+        book.sheet_names.return_value = [u'Sheet1', u'Sheet2']
+        book.sheet_by_name.side_effect = sheets.__getitem__
+        path = join(self.tmpdir, '20121106__id__general__county.xls')
+        self.assertEqual([
+            [u'County', u'Votes'],
+            [u'Ada', u'10'],
+            [u'Adams', u'10'],
+        ], list(tabular_file_rows(path)))
+        open_workbook.assert_called_once_with(path, on_demand=True)
+        self.assertEqual([call(u'Sheet1'), call(u'Sheet2')],
+            book.unload_sheet.call_args_list)
+        book.release_resources.assert_called_once_with()
@@ -0,0 +1,203 @@
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+from datetime import datetime
+from unittest import TestCase
+
+from bson import ObjectId
+from mock import MagicMock, patch
+
+from openelex.base.transform import (_range_query, changed_since, id_ranges,
+    map_documents, registry, run_transforms)
+from openelex.models import Candidate, Result
+
+# Written to by the transforms below, which may run in worker processes
+OUTPUT_DIR = None
+
+def _touch(name):
+    open(join(OUTPUT_DIR, name), 'a').close()
+
+def clean_offices():
+    _touch('clean_offices')
+
+def parse_names():
+    _touch('parse_names')
+
+def slug_names():
+    _touch('slug_names')
+
+def count_votes():
+    _touch('count_votes')
+
+def reparse_names(since=None):
+    _touch('reparse_names-%s' % (since and since.year))
+
+def upper_slug(doc):
+    if doc['slug'] != doc['slug'].upper():
+        return {'$set': {'slug': doc['slug'].upper()}}
+
+def broken():
+    raise ValueError("bad data")
+
+
+class TestTransformRegistry(TestCase):
+
+    def setUp(self):
+        global OUTPUT_DIR
+        OUTPUT_DIR = mkdtemp()
+        self._saved = registry._registry.pop('zz', None)
+        registry.register('zz', clean_offices, inputs=['contest.raw_office'],
+            outputs=['contest.office'])
+        registry.register('zz', parse_names,
+            inputs=['candidate.raw_full_name'],
+            outputs=['candidate.given_name', 'candidate.family_name'])
+        registry.register('zz', slug_names, inputs=['candidate'],
+            outputs=['candidate.slug'])
+        registry.register('zz', count_votes, inputs=['result.votes'],
+            outputs=['result.total_votes'], depends_on=['clean_offices'])
+
+    def tearDown(self):
+        rmtree(OUTPUT_DIR)
+        registry._registry.pop('zz', None)
+        if self._saved is not None:
+            registry._registry['zz'] = self._saved
+
+    def test_dependencies(self):
+        deps = registry.dependencies('zz')
+        self.assertEqual(set(), deps['clean_offices'])
+        self.assertEqual(set(), deps['parse_names'])
+        # Reads the whole candidate collection, which parse_names writes to
+        self.assertEqual(set(['parse_names']), deps['slug_names'])
+        self.assertEqual(set(['clean_offices']), deps['count_votes'])
+
+    def test_undeclared_transforms_run_alone(self):
+        registry.register('zz', broken)
+        self.assertEqual(set(['clean_offices', 'parse_names', 'slug_names',
+            'count_votes']), registry.dependencies('zz')['broken'])
+
+    def test_plan(self):
+        plan = registry.plan('zz')
+        self.assertEqual(['clean_offices', 'parse_names', 'slug_names',
+            'count_votes'], list(plan))
+        # Dependencies on excluded transforms are assumed to be satisfied
+        plan = registry.plan('zz', exclude=['parse_names'])
+        self.assertEqual(set(), plan['slug_names'])
+        plan = registry.plan('zz', include=['count_votes'])
+        self.assertEqual(['count_votes'], list(plan))
+
+    def test_circular_dependencies(self):
+        registry.all('zz')['clean_offices'].depends_on = ('count_votes',)
+        self.assertRaises(ValueError, registry.plan, 'zz')
+
+    def test_run_transforms(self):
+        for workers in (1, 2):
+            timings = run_transforms('zz', exclude=['count_votes'],
+                workers=workers)
+            self.assertEqual(set(['clean_offices', 'parse_names',
+                'slug_names']), set(timings))
+            self.assertTrue(list(timings).index('parse_names') <
+                list(timings).index('slug_names'))
+            for name in timings:
+                open(join(OUTPUT_DIR, name)).close()
+
+    @patch('openelex.base.transform.result_partition')
+    def test_routes_results(self, result_partition):
+        "transforms run with Result routed to the state's partition"
+        run_transforms('zz', include=['clean_offices'])
+        result_partition.assert_called_once_with('zz')
+        open(join(OUTPUT_DIR, 'clean_offices')).close()
+
+    def test_failed_transform(self):
+        registry.register('zz', broken)
+        for workers in (1, 2):
+            self.assertRaises(RuntimeError, run_transforms, 'zz',
+                workers=workers)
+
+    def test_changed_since(self):
+        self.assertEqual({}, changed_since(Candidate, None))
+        since = datetime(2014, 1, 1)
+        self.assertEqual({'upd': {'$gte': since}},
+            changed_since(Result, since))
+
+    @patch('openelex.base.transform.set_watermark')
+    @patch('openelex.base.transform.get_watermark')
+    def test_incremental_transform(self, get_watermark, set_watermark):
+        "incremental transforms get their watermark and advance it"
+        registry.register('zz', reparse_names, inputs=['candidate'],
+            outputs=['candidate.given_name'], incremental=True)
+        get_watermark.return_value = datetime(2014, 1, 1)
+        run_transforms('zz', include=['reparse_names'])
+        open(join(OUTPUT_DIR, 'reparse_names-2014')).close()
+        get_watermark.assert_called_once_with('zz', 'reparse_names')
+        self.assertEqual(('zz', 'reparse_names'),
+            set_watermark.call_args[0][:2])
+
+        run_transforms('zz', include=['reparse_names'], full=True)
+        open(join(OUTPUT_DIR, 'reparse_names-None')).close()
+        self.assertEqual(1, get_watermark.call_count)
+        self.assertEqual(2, set_watermark.call_count)
+
+    @patch('openelex.base.transform.set_watermark')
+    @patch('openelex.base.transform.get_watermark')
+    def test_failed_incremental_transform(self, get_watermark, set_watermark):
+        "watermarks aren't advanced when a transform fails"
+        def broken(since=None):
+            raise ValueError("bad data")
+        registry.register('zz', broken, inputs=[], outputs=[],
+            incremental=True)
+        get_watermark.return_value = None
+        self.assertRaises(RuntimeError, run_transforms, 'zz',
+            include=['broken'])
+        self.assertFalse(set_watermark.called)
+
+
+class TestMapDocuments(TestCase):
+
+    def test_id_ranges(self):
+        ids = [ObjectId() for i in range(3)]
+        collection = MagicMock()
+        collection.find.return_value.count.return_value = 10
+        cursor = collection.find.return_value.sort.return_value.skip
+        cursor.return_value.limit.side_effect = [[{'_id': pk}] for pk in ids]
+        ranges = id_ranges(collection, {'state': 'MD'}, 4)
+        self.assertEqual([(None, ids[0]), (ids[0], ids[1]), (ids[1], ids[2]),
+            (ids[2], None)], ranges)
+        self.assertEqual([4, 6], [call[0][0]
+            for call in cursor.call_args_list[1:]])
+
+    def test_id_ranges_few_documents(self):
+        collection = MagicMock()
+        collection.find.return_value.count.return_value = 2
+        self.assertEqual([(None, None)],
+            id_ranges(collection, {'state': 'MD'}, 4))
+
+    def test_range_query(self):
+        first, last = ObjectId(), ObjectId()
+        self.assertEqual({'state': 'MD'}, _range_query({'state': 'MD'},
+            None, None))
+        self.assertEqual({'$and': [{'state': 'MD'},
+            {'_id': {'$gte': first, '$lt': last}}]},
+            _range_query({'state': 'MD'}, first, last))
+
+    @patch.object(Candidate, '_get_collection')
+    def test_map_documents(self, mock_collection):
+        "updates are written in bulk, skipping documents func leaves alone"
+        collection = mock_collection.return_value
+        docs = [{'_id': ObjectId(), 'slug': slug}
+            for slug in ('a', 'B', 'c')]
+        collection.find.return_value.batch_size.return_value = docs
+        bulk = collection.initialize_unordered_bulk_op.return_value
+        prepare, finish = MagicMock(), MagicMock()
+        updated = map_documents(Candidate, upper_slug, {'state': 'MD'},
+            fields=['slug'], workers=1, batch_size=2, prepare=prepare,
+            finish=finish)
+        self.assertEqual(2, updated)
+        collection.find.assert_called_once_with({'state': 'MD'},
+            fields=['slug'])
+        self.assertEqual([docs[:2], docs[2:]],
+            [call[0][0] for call in prepare.call_args_list])
+        self.assertEqual(2, finish.call_count)
+        update_one = bulk.find.return_value.update_one
+        self.assertEqual([{'$set': {'slug': 'A'}}, {'$set': {'slug': 'C'}}],
+            [call[0][0] for call in update_one.call_args_list])
+        self.assertEqual(2, bulk.execute.call_count)
@@ -0,0 +1,31 @@
+from unittest import TestCase
+
+from openelex.us.fl.load import LoadResults
+
+
+class TestResultsSpec(TestCase):
+
+    header = ['ElectionDate', 'PartyCode', 'PartyName', 'RaceCode',
+        'OfficeDesc', 'Juris1num', 'Juris2num', 'Precincts',
+        'PrecinctsReporting', 'CanNameLast', 'CanNameFirst', 'CanNameMiddle',
+        'CanVotes', 'CountyCode', 'CountyName']
+    mapping = {
+        'generated_filename': '20121106__fl__general.txt',
+        'ocd_id': 'ocd-division/country:us/state:fl',
+        'name': 'Florida',
+    }
+
+    def test_compile(self):
+        transform = LoadResults().spec.compile(self.header, self.mapping)
+        party, contest, candidate, result = transform([u'11/6/2012', u'DEM',
+            u'Democrat', u'USS', u'United States Senator', u'', u'', u'6',
+            u'6', u'Nelson', u'Bill', u'', u'1,234', u'SAI',
+            u'St. Johns'])
+        self.assertEqual(u'DEM', party)
+        self.assertEqual({'raw_office': u'United States Senator',
+            'raw_district': u''}, contest)
+        self.assertEqual({'raw_full_name': u'Bill Nelson'}, candidate)
+        self.assertEqual(1234, result['raw_total_votes'])
+        self.assertEqual(u'St. Johns', result['jurisdiction'])
+        self.assertEqual('ocd-division/country:us/state:fl/county:st_johns',
+            result['ocd_id'])
@@ -0,0 +1,159 @@
+from unittest import TestCase
+
+from bson import ObjectId
+from mock import patch
+
+from openelex.models import Candidate
+from openelex.us.md.load import (COUNTY_SPEC, PRECINCT_SPEC, LoadResults,
+    primary_2000_rows)
+
+
+class TestCandidateParties(TestCase):
+
+    def setUp(self):
+        self.loader = LoadResults()
+        self.candidate = Candidate(id=ObjectId(), raw_parties=['DEM'])
+
+    @patch.object(Candidate, '_get_collection')
+    def test_parties_flushed_in_bulk(self, mock_collection):
+        "new parties are queued per candidate and written in one bulk op"
+        for party in ('DEM', 'REP', 'REP'):
+            self.loader._update_non2002_candidate_parties({'Party': party},
+                self.candidate)
+        self.assertEqual({self.candidate.pk: set(['REP'])},
+            self.loader._cand_parties)
+
+        self.loader.flush_candidate_parties()
+        bulk = mock_collection.return_value.initialize_unordered_bulk_op.return_value
+        bulk.find.assert_called_once_with({'_id': self.candidate.pk})
+        self.assertEqual(1, bulk.find.return_value.update_one.call_count)
+        (update,), _ = bulk.find.return_value.update_one.call_args
+        self.assertEqual({'raw_parties': {'$each': ['REP']}},
+            update['$addToSet'])
+        self.assertEqual(['updated'], update['$set'].keys())
+        bulk.execute.assert_called_once_with()
+        self.assertEqual({}, self.loader._cand_parties)
+
+    @patch.object(Candidate, '_get_collection')
+    def test_no_new_parties(self, mock_collection):
+        "nothing is written when every party was already known"
+        self.loader._update_non2002_candidate_parties({'Party': 'DEM'},
+            self.candidate)
+        self.loader.flush_candidate_parties()
+        self.assertFalse(mock_collection.called)
+
+
+class TestSpecs(TestCase):
+
+    header = ['Candidate Name', 'Party', 'Office Name', 'Office District',
+        'Winner', 'Write-In?', 'Election District', 'Election Precinct',
+        'Election Night Votes', 'Total Votes']
+    mapping = {
+        'generated_filename': '20121106__md__general__allegany.csv',
+        'ocd_id': 'ocd-division/country:us/state:md/county:allegany',
+        'name': 'Allegany',
+    }
+
+    def test_county(self):
+        transform = COUNTY_SPEC.compile(self.header, self.mapping)
+        party, contest, candidate, result = transform([u'Barack Obama',
+            u'DEM', u'President - Vice Pres', u'', u'N', u'', u'', u'',
+            u'6,020', u'6120'])
+        self.assertEqual(u'DEM', party)
+        self.assertEqual({'raw_office': u'President - Vice Pres',
+            'raw_district': u''}, contest)
+        self.assertEqual({'raw_full_name': u'Barack Obama'}, candidate)
+        self.assertEqual({
+            'reporting_level': 'county',
+            'ocd_id': 'ocd-division/country:us/state:md/county:allegany',
+            'jurisdiction': 'Allegany',
+            'party': u'DEM',
+            'raw_total_votes': 6120,
+            'raw_winner': u'N',
+            'raw_write_in': u'',
+            'raw_vote_breakdowns': {'election_night_total': 6020},
+        }, result)
+
+    def test_precinct(self):
+        transform = PRECINCT_SPEC.compile(self.header, self.mapping)
+        party, contest, candidate, result = transform([u'Barack Obama',
+            u'DEM', u'President - Vice Pres', u'', u'N', u'', u'01', u'002',
+            u'120', u''])
+        self.assertEqual(120, result['raw_total_votes'])
+        self.assertEqual(u'002', result['raw_jurisdiction'])
+        self.assertEqual(u'Allegany 01-002', result['jurisdiction'])
+        self.assertEqual({'election_night_total': 120},
+            result['raw_vote_breakdowns'])
+
+    def test_non_target_offices_skipped(self):
+        transform = COUNTY_SPEC.compile(self.header, self.mapping)
+        self.assertEqual(None, transform([u'Jane Doe', u'DEM',
+            u'Judge of the Circuit Court', u'', u'N', u'', u'', u'', u'1',
+            u'1']))
+
+
+class TestLegacyFiles(TestCase):
+
+    def setUp(self):
+        self.loader = LoadResults()
+
+    def test_primary_2000_rows(self):
+        "sections are parsed in one pass, skipping non-target offices"
+        rows = [
+            [u'President and Vice President of the United States - Democratic Party'],
+            [u'', u'Al Gore Winner', u'', u'Bill Bradley'],
+            [u'Allegany', u'1,200', u'', u'300'],
+            [u''],
+            [u'Judge of the Circuit Court'],
+            [u'', u'Jane Doe Winner'],
+            [u'Allegany', u'50'],
+            [u'Representative in Congress - Republican Party - District 06'],
+            [u'', u'Roscoe Bartlett Winner'],
+            [u'Baltimore County', u'400'],
+        ]
+        self.assertEqual([
+            [u'President - Vice Pres', u'', u'DEM', u'Al Gore', u'Winner', u'Allegany', u'1,200'],
+            [u'President - Vice Pres', u'', u'DEM', u'Bill Bradley', u'', u'Allegany', u'300'],
+            [u'U.S. Congress', u'06', u'REP', u'Roscoe Bartlett', u'Winner', u'Baltimore County', u'400'],
+        ], list(primary_2000_rows(rows, self.loader.counties)))
+
+    def test_primary_2000_blank_votes(self):
+        "blank vote cells don't shift later counts onto other candidates"
+        rows = [
+            [u'U.S. Senator - Republican Party'],
+            [u'', u'Paul Rappaport Winner', u'John Kimble', u'Kenneth Wayman'],
+            [u'Allegany', u'', u'20', u'30'],
+            [u'Baltimore County', u'100', u'40'],
+        ]
+        votes = [(row[3], row[5], row[6])
+            for row in primary_2000_rows(rows, self.loader.counties)]
+        self.assertEqual([
+            (u'Paul Rappaport', u'Allegany', u''),
+            (u'John Kimble', u'Allegany', u'20'),
+            (u'Kenneth Wayman', u'Allegany', u'30'),
+            (u'Paul Rappaport', u'Baltimore County', u'100'),
+            (u'John Kimble', u'Baltimore County', u'40'),
+            (u'Kenneth Wayman', u'Baltimore County', u''),
+        ], votes)
+
+    def test_2002_spec(self):
+        spec = self.loader.spec_2002
+        transform = spec.compile(spec.fieldnames,
+            {'generated_filename': '20021105__md__general.txt'})
+        party, contest, candidate, result = transform([
+            u'Governor / Lt. Governor', u'-', u'Baltimore City', u'zz998',
+            u'\\N', u'Other Write-Ins', u'', u'0', u'(Vote for One)', u'120',
+            u'\\N'])
+        self.assertEqual({'raw_office': u'Governor / Lt. Governor',
+            'raw_district': u'', 'raw_vote_for': u'(Vote for One)'}, contest)
+        self.assertEqual(u'Other Write-Ins zz998', candidate['raw_full_name'])
+        self.assertEqual(u'', candidate['raw_additional_name'])
+        self.assertTrue(result['write_in'])
+        self.assertEqual(120, result['raw_total_votes'])
+        self.assertEqual('ocd-division/country:us/state:md/place:baltimore',
+            result['ocd_id'])
+        self.assertEqual(u'Baltimore City', result['jurisdiction'])
+        # Local races aren't loaded
+        self.assertEqual(None, transform([u'Judge of the Orphans Court',
+            u'-', u'Baltimore City', u'Doe', u'\\N', u'Jane', u'DEM', u'1',
+            u'(Vote for One)', u'20', u'\\N']))
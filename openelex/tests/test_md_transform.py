@@ -0,0 +1,54 @@
+from datetime import datetime
+from unittest import TestCase
+
+from bson import ObjectId
+from mock import patch
+
+from openelex.models import Candidate, ParsedName
+from openelex.us.md.transform import (PRE_2003_ELECTION_ID,
+    parse_names_after_2002)
+
+
+class TestParseNames(TestCase):
+
+    def test_pre_2003_elections(self):
+        for election_id in ('md-2000-03-07-primary', 'md-2002-11-05-general'):
+            self.assertTrue(PRE_2003_ELECTION_ID.match(election_id))
+        self.assertFalse(PRE_2003_ELECTION_ID.match('md-2012-11-06-general'))
+
+    @patch.object(ParsedName, '_get_collection')
+    @patch.object(Candidate, '_get_collection')
+    def test_bulk_updates(self, mock_collection, mock_names):
+        "parsed names are written in batches, skipping Other write-ins"
+        collection = mock_collection.return_value
+        cands = [
+            {'_id': ObjectId(), 'raw_full_name': 'Barack Obama', 'slug': 'barack-obama'},
+            {'_id': ObjectId(), 'raw_full_name': 'Other Write-Ins', 'slug': 'other-writeins'},
+            {'_id': ObjectId(), 'raw_full_name': 'Mitt Romney', 'slug': 'mitt-romney'},
+            {'_id': ObjectId(), 'raw_full_name': 'Jill Stein', 'slug': 'jill-stein'},
+        ]
+        collection.find.return_value.batch_size.return_value = cands
+        mock_names.return_value.find.return_value = []
+        bulk = collection.initialize_unordered_bulk_op.return_value
+        parse_names_after_2002(batch_size=2, workers=1)
+        self.assertEqual(2, bulk.execute.call_count)
+        # New names are stored after each batch
+        names_bulk = mock_names.return_value.initialize_unordered_bulk_op
+        self.assertEqual(2, names_bulk.return_value.execute.call_count)
+        update = bulk.find.return_value.update_one.call_args_list[0][0][0]
+        self.assertEqual('Barack', update['$set']['given_name'])
+        self.assertEqual('Obama', update['$set']['family_name'])
+        self.assertEqual(['raw_full_name', 'slug'],
+            collection.find.call_args[1]['fields'])
+
+    @patch.object(ParsedName, '_get_collection')
+    @patch.object(Candidate, '_get_collection')
+    def test_since(self, mock_collection, mock_names):
+        "only candidates loaded since the watermark are selected"
+        collection = mock_collection.return_value
+        collection.find.return_value.batch_size.return_value = []
+        since = datetime(2014, 1, 1)
+        parse_names_after_2002(since=since, workers=1)
+        query = collection.find.call_args[0][0]
+        self.assertEqual({'$gte': since}, query['updated'])
+        self.assertEqual('MD', query['state'])
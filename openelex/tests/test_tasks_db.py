@@ -0,0 +1,97 @@
+from unittest import TestCase
+
+from bson import ObjectId
+from mock import MagicMock, patch
+
+from openelex.models import Candidate, Contest, Result
+from openelex.tasks.db import _dedupe, _migrate_results
+
+
+class TestMigrateResults(TestCase):
+
+    @patch('openelex.tasks.db.switch_collection')
+    @patch.object(Result, 'ensure_indexes')
+    @patch.object(Result, '_get_db')
+    def test_migrate(self, mock_db, ensure_indexes, switch_collection):
+        "indexes are dropped before the rename and rebuilt after conversion"
+        collection = MagicMock()
+        mock_db.return_value.__getitem__.return_value = collection
+        ids = [ObjectId(), ObjectId(), ObjectId()]
+        collection.find.return_value = [
+            {'_id': ids[0], 'r_vb': {'absentee_total': u'1,204'}},
+            {'_id': ids[1], 'r_vb': {'absentee_total': u'n/a',
+                'provisional_total': u'3'}},
+            {'_id': ids[2], 'r_vb': {'absentee_total': 5}},
+        ]
+        ensure_indexes.side_effect = lambda: collection.ensure_indexes()
+        _migrate_results('result_md', 1000)
+
+        mock_db.return_value.__getitem__.assert_called_once_with('result_md')
+        self.assertEqual(['drop_indexes', 'update',
+            'initialize_unordered_bulk_op', 'find', 'ensure_indexes'],
+            [call[0] for call in collection.method_calls
+                if '.' not in call[0]])
+        switch_collection.assert_called_once_with(Result, 'result_md')
+        renames = collection.update.call_args[0][1]['$rename']
+        self.assertEqual('eid', renames['election_id'])
+        bulk = collection.initialize_unordered_bulk_op.return_value
+        self.assertEqual([{'_id': ids[0]}, {'_id': ids[1]}],
+            [call[0][0] for call in bulk.find.call_args_list])
+        # Non-numeric values are left as they are
+        self.assertEqual([
+            {'$set': {'r_vb': {'absentee_total': 1204}}},
+            {'$set': {'r_vb': {'absentee_total': u'n/a',
+                'provisional_total': 3}}},
+        ], [call[0][0] for call in
+            bulk.find.return_value.update_one.call_args_list])
+
+
+class TestDedupe(TestCase):
+
+    def setUp(self):
+        for klass in (Contest, Candidate):
+            patcher = patch.object(klass, '_get_collection')
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch.object(Result, '_get_db')
+        self.results = patcher.start().return_value.__getitem__.return_value
+        self.addCleanup(patcher.stop)
+
+    def test_contests(self):
+        "the contest with the derived id is kept and references repointed"
+        collection = Contest._get_collection()
+        derived = Contest.make_id('md-2012-11-06-general', 'us-senate')
+        legacy = ObjectId()
+        collection.aggregate.return_value = [{
+            '_id': {'election_id': 'md-2012-11-06-general',
+                'slug': 'us-senate'},
+            'ids': [legacy, derived],
+        }]
+        _dedupe(Contest, ('election_id', 'slug'), 'contest')
+        Candidate._get_collection().update.assert_called_once_with(
+            {'contest': {'$in': [legacy]}}, {'$set': {'contest': derived}},
+            multi=True)
+        self.results.update.assert_called_once_with(
+            {'con': {'$in': [legacy]}}, {'$set': {'con': derived}},
+            multi=True)
+        collection.remove.assert_called_once_with({'_id': {'$in': [legacy]}})
+
+    def test_candidates(self):
+        "without a derived id the oldest is kept, gaining the others' parties"
+        collection = Candidate._get_collection()
+        first, second = ObjectId(), ObjectId()
+        collection.aggregate.return_value = [{
+            '_id': {'election_id': 'md-2012-11-06-general',
+                'contest_slug': 'us-senate', 'slug': 'ben-cardin'},
+            'ids': [second, first],
+        }]
+        collection.find.return_value = [{'_id': second,
+            'raw_parties': ['DEM']}]
+        _dedupe(Candidate, ('election_id', 'contest_slug', 'slug'),
+            'candidate')
+        collection.update.assert_called_once_with({'_id': first},
+            {'$addToSet': {'raw_parties': {'$each': ['DEM']}}})
+        self.results.update.assert_called_once_with(
+            {'cand': {'$in': [second]}}, {'$set': {'cand': first}},
+            multi=True)
+        collection.remove.assert_called_once_with({'_id': {'$in': [second]}})
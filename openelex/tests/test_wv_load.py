@@ -0,0 +1,100 @@
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+import hashlib
+
+from mock import Mock, patch
+
+from openelex.base.load import BaseLoader, ElectionContext
+from openelex.models import Candidate, Result
+from openelex.us.wv.load import LoadResults
+
+
+class TestLoadNormalizedFile(TestCase):
+
+    rows = [
+        [u'year', u'election', u'office', u'district', u'party', u'candidate', u'county', u'votes', u'winner'],
+        [u'2004', u'general', u'House of Delegates', u'1', u'D', u'Joe DeLong', u'Brooke', u'687', u''],
+        [u'2004', u'general', u'House of Delegates', u'1', u'D', u'Joe DeLong', u'Hancock', u'9048', u''],
+        [u'2004', u'general', u'House of Delegates', u'1', u'D', u'Joe DeLong', u'Totals', u'9735', u'1'],
+        [u'2004', u'general', u'House of Delegates', u'1', u'R', u'Pat Chaney', u'Brooke', u'172', u''],
+        [u'2004', u'general', u'House of Delegates', u'1', u'R', u'Pat Chaney', u'Totals', u'3348', u''],
+        [u'2004', u'general', u'House of Delegates', u'2', u'D', u'Tim Ennis', u'Ohio', u'2149', u''],
+    ]
+
+    def setUp(self):
+        self.loader = LoadResults()
+        self.loader.source = '20041102__wv__general__house_of_delegates.pdf'
+        self.loader.context = ElectionContext.build('wv-2004-11-02-general',
+            self.loader.source, 'wv', {'start_date': '2004-11-02',
+            'end_date': '2004-11-02', 'race_type': 'general',
+            'result_type': 'certified', 'special': False})
+        for klass in (Result, Candidate):
+            patcher = patch.object(klass, '_get_collection')
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch.object(BaseLoader, 'bulk_upsert')
+        patcher.start().return_value = {}
+        self.addCleanup(patcher.stop)
+
+    def test_load(self):
+        "totals rows are checked and dropped, and winners copied to counties"
+        count = self.loader.load_normalized_file({}, self.rows)
+        self.assertEqual(4, count)
+        docs = Result._get_collection().insert.call_args[0][0]
+        self.assertEqual([u'Brooke', u'Hancock', u'Brooke', u'Ohio'],
+            [doc['r_jur'] for doc in docs])
+        self.assertEqual([u'1', u'1', u'', u''],
+            [doc['r_win'] for doc in docs])
+        self.assertEqual('ocd-division/country:us/state:wv/county:ohio',
+            docs[3]['ocd'])
+        self.assertEqual([(self.loader.source, 'house-of-delegates-1',
+            'pat-chaney', 172, 3348)], self.loader.mismatches)
+
+
+class TestRun(TestCase):
+
+    def setUp(self):
+        self.tmpdir = mkdtemp()
+        self.addCleanup(rmtree, self.tmpdir)
+        self.loader = LoadResults()
+        self.loader.cache = Mock(abspath=self.tmpdir)
+        patcher = patch.object(LoadResults, 'load_normalized_file')
+        self.load = patcher.start()
+        self.load.return_value = 0
+        self.addCleanup(patcher.stop)
+        patcher = patch.object(LoadResults, 'clear_results')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write(self, name, text):
+        with open(join(self.tmpdir, name), 'wb') as f:
+            f.write(text)
+
+    def test_content_hash(self):
+        "the normalized CSV is hashed, not the PDF it was converted from"
+        text = ','.join(TestLoadNormalizedFile.rows[0]) + '\n'
+        self.write('20041102__wv__general__prez.csv', text)
+        mapping = {'generated_filename': '20041102__wv__general__prez.pdf'}
+        self.assertEqual(hashlib.md5(text).hexdigest(),
+            self.loader.content_hash(mapping))
+
+    def test_skip_sos_csv(self):
+        "SOS-layout CSVs are skipped rather than loaded as normalized files"
+        self.write('20121106__wv__general__barbour.csv',
+            'County,Office,Candidate,Votes\n')
+        self.loader.run({'generated_filename':
+            '20121106__wv__general__barbour.csv',
+            'election': 'wv-2012-11-06-general'})
+        self.assertFalse(self.load.called)
+
+    @patch.object(LoadResults, 'record_load')
+    def test_skip_unnormalized_csv(self, record_load):
+        "CSVs converted from PDFs are checked for the normalized columns"
+        self.write('20041102__wv__general__prez.csv', 'County,Votes\n')
+        self.loader.run({'generated_filename':
+            '20041102__wv__general__prez.pdf',
+            'election': 'wv-2004-11-02-general'})
+        self.assertFalse(self.load.called)
+        self.assertFalse(record_load.called)
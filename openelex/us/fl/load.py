@@ -0,0 +1,75 @@
+"""
+Load Florida Department of State ResultsExtract files.
+
+Each file is a tab-delimited extract of county-level results for every
+contest of one statewide election, so files can be loaded in parallel
+across elections:
+
+    invoke load.run --state=fl --workers=4
+
+"""
+import datetime
+
+from openelex.base.load import BaseLoader, ElectionContext, RunContext
+from openelex.base.tabular import Column, TabularSpec, to_int
+
+from .datasource import Datasource
+
+
+def county_name(name):
+    "Normalize a county name for matching ResultsExtract and fl.csv names"
+    name = name.strip()
+    if name.endswith(' County'):
+        name = name[:-len(' County')]
+    return name.lower()
+
+
+def results_spec(county_ocd_ids):
+    """Layout of ResultsExtract files
+
+    county_ocd_ids maps normalized county names to OCD ids.
+    """
+    def ocd_id(row, mapping):
+        return county_ocd_ids.get(county_name(row['CountyName']))
+
+    return TabularSpec(
+        office=Column('OfficeDesc'),
+        district=Column('Juris1num'),
+        party=Column('PartyCode'),
+        candidate=(Column('CanNameFirst'), Column('CanNameMiddle'),
+            Column('CanNameLast')),
+        votes=Column('CanVotes', to_int),
+        result_fields={
+            'raw_jurisdiction': Column('CountyName', lambda val: val),
+            'jurisdiction': Column('CountyName'),
+            'ocd_id': ocd_id,
+        },
+        reporting_level='county',
+        delimiter='\t',
+    )
+
+
+class LoadResults(BaseLoader):
+
+    def __init__(self):
+        super(LoadResults, self).__init__()
+        self.datasource = Datasource()
+        self.run_context = RunContext(self.datasource)
+        self.spec = results_spec(dict(
+            (county_name(row['county']), row['ocd_id'])
+            for row in self.datasource.jurisdiction_mappings()))
+
+    def run(self, mapping):
+        self.source = mapping['generated_filename']
+        self.timestamp = datetime.datetime.now()
+        self.election_id = mapping['election']
+        self.context = ElectionContext.build(self.election_id, self.source,
+            self.state, self.run_context.election(self.election_id),
+            timestamp=self.timestamp)
+
+        print("LOAD: %s" % self.source)
+        # Reload results fresh every time
+        self.clear_results(self.source)
+
+        row_count = self.load_tabular(mapping, self.spec, self.context)
+        self.record_load(mapping, row_count)
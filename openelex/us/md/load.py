@@ -1,161 +1,300 @@
-from os.path import exists, join
+from os.path import join
 import datetime
 import re
 import unicodecsv
 
-from openelex.base.load import BaseLoader
-from openelex.models import Candidate, Result, Contest
-from openelex.lib.text import slugify
+from openelex.base.load import BaseLoader, ElectionContext, RunContext
+from openelex.base.tabular import Column, TabularSpec, csv_rows, to_int
+from openelex.models import Result
 
 from .datasource import Datasource
 
 
+# Offices loaded from result files
+TARGET_OFFICES = frozenset([
+    'President - Vice Pres',
+    'U.S. Senator',
+    'U.S. Congress',
+    'Governor / Lt. Governor',
+    'Comptroller',
+    'Attorney General',
+    'State Senator',
+    'House of Delegates'
+])
+
+
+def _precinct_jurisdiction(row, mapping):
+    return u"%s %s-%s" % (mapping['name'], row['Election District'],
+        row['Election Precinct'])
+
+def _precinct_ocd_id(row, mapping):
+    # Precinct files are per county, and mapped to the county's OCD id
+    return u"%s/precinct:%s-%s" % (mapping['ocd_id'],
+        row['Election District'], row['Election Precinct'])
+
+# Layout of non-2002 county and precinct result files
+COUNTY_SPEC = TabularSpec(
+    office=Column('Office Name'),
+    district=Column('Office District'),
+    party=Column('Party'),
+    candidate=Column('Candidate Name'),
+    votes=Column('Total Votes', to_int),
+    result_fields={
+        'raw_winner': Column('Winner'),
+        'raw_write_in': Column('Write-In?', required=False),
+        'raw_vote_breakdowns.election_night_total': Column('Election Night Votes', to_int, required=False),
+        'raw_vote_breakdowns.absentee_total': Column('Absentees Votes', to_int, required=False),
+        'raw_vote_breakdowns.provisional_total': Column('Provisional Votes', to_int, required=False),
+        'raw_vote_breakdowns.second_absentee_total': Column('2nd Absentees Votes', to_int, required=False),
+    },
+    mapping_fields={
+        'ocd_id': 'ocd_id',
+        'jurisdiction': 'name',
+    },
+    reporting_level='county',
+    offices=TARGET_OFFICES,
+)
+
+PRECINCT_SPEC = TabularSpec(
+    office=Column('Office Name'),
+    district=Column('Office District'),
+    party=Column('Party'),
+    candidate=Column('Candidate Name'),
+    votes=Column('Election Night Votes', to_int),
+    result_fields={
+        'raw_jurisdiction': Column('Election Precinct', lambda val: val),
+        'jurisdiction': _precinct_jurisdiction,
+        'ocd_id': _precinct_ocd_id,
+        'raw_winner': Column('Winner'),
+        'raw_write_in': Column('Write-In?', required=False),
+        'raw_vote_breakdowns.election_night_total': Column('Election Night Votes', to_int),
+    },
+    reporting_level='precinct',
+    offices=TARGET_OFFICES,
+)
+
+
+def county_lookup(jurisdictions):
+    """Map county names as they appear in results files to (OCD id, name)
+
+    Names are matched both as is and with a " County" suffix, e.g.
+    "Allegany" and "Allegany County".
+    """
+    counties = {}
+    for juris in jurisdictions:
+        county = (juris['ocd_id'], juris['name'])
+        counties[juris['name']] = county
+        counties[juris['name'] + ' County'] = county
+    return counties
+
+
+def _county_fields(counties, column):
+    "ocd_id and jurisdiction result fields looked up from a county column"
+    def county(row):
+        return counties.get(row[column].strip(), (None, None))
+    return {
+        'raw_jurisdiction': Column(column, lambda val: val),
+        'ocd_id': lambda row, mapping: county(row)[0],
+        'jurisdiction': lambda row, mapping: county(row)[1],
+    }
+
+
+def _text_2002(val):
+    # The 2002 files use \N for empty values, and - for no district
+    val = val.strip()
+    return u'' if val in (u'\\N', u'-') else val
+
+def results_2002_spec(counties):
+    """Layout of the pipe-delimited, headerless 2002 result files
+
+    Each row is one candidate's total in a county. The vote_for column
+    is the contest's ballot instruction, e.g. "(Vote for One)", rather
+    than a type of vote, so it's kept on the Contest.
+    """
+    result_fields = _county_fields(counties, 'jurisdiction')
+    result_fields.update({
+        'raw_winner': Column('winner'),
+        # zz998 is for write-ins
+        'write_in': lambda row, mapping: row['last'].strip() == 'zz998',
+    })
+    return TabularSpec(
+        office=Column('office'),
+        district=Column('district', _text_2002),
+        party=Column('party', _text_2002),
+        candidate=(Column('first', _text_2002), Column('middle', _text_2002),
+            Column('last', _text_2002)),
+        votes=Column('votes', to_int),
+        contest_fields={'raw_vote_for': Column('vote_for', _text_2002)},
+        candidate_fields={
+            'raw_given_name': Column('first', _text_2002),
+            'raw_additional_name': Column('middle', _text_2002),
+            'raw_family_name': Column('last', _text_2002),
+        },
+        result_fields=result_fields,
+        reporting_level='county',
+        offices=TARGET_OFFICES,
+        fieldnames=['office', 'district', 'jurisdiction', 'last', 'middle',
+            'first', 'party', 'winner', 'vote_for', 'votes', 'fill2'],
+        delimiter='|',
+    )
+
+
+# Offices loaded from the 2000 primary file, by the start of their section
+# header
+PRIMARY_2000_OFFICES = (
+    ('President and Vice President', 'President - Vice Pres'),
+    ('U.S. Senator', 'U.S. Senator'),
+    ('Representative in Congress', 'U.S. Congress'),
+)
+
+PRIMARY_2000_FIELDNAMES = ['office', 'district', 'party', 'candidate',
+    'winner', 'county', 'votes']
+
+
+def primary_2000_spec(counties):
+    "Layout of rows yielded by primary_2000_rows"
+    result_fields = _county_fields(counties, 'county')
+    result_fields['raw_winner'] = Column('winner')
+    return TabularSpec(
+        office=Column('office'),
+        district=Column('district'),
+        party=Column('party'),
+        candidate=Column('candidate'),
+        votes=Column('votes', to_int),
+        result_fields=result_fields,
+        reporting_level='county',
+        fieldnames=PRIMARY_2000_FIELDNAMES,
+    )
+
+
+def primary_2000_rows(rows, counties):
+    """Flatten the 2000 primary file into one row per candidate and county
+
+    The file is a series of sections, one per office and party: a header
+    naming the office, a row of candidate names with a blank first cell,
+    where the winner's name ends in "Winner", then a row of votes per
+    county. Each candidate's votes are in the same column as their name,
+    and blank vote cells are passed on as blanks, which load as zero.
+    Any other row starts a new section, and sections for offices not in
+    PRIMARY_2000_OFFICES are skipped.
+
+    Yields lists of values for PRIMARY_2000_FIELDNAMES.
+    """
+    office = district = party = candidates = None
+    for values in rows:
+        cells = [val.strip() for val in values]
+        if not any(cells):
+            continue
+        label = cells[0]
+        if not label:
+            if office is not None:
+                candidates = []
+                for i, cell in enumerate(cells):
+                    if i and cell:
+                        name, winner, rest = cell.partition(' Winner')
+                        candidates.append((i, name.strip(),
+                            (winner + rest).strip()))
+        elif label in counties:
+            if candidates:
+                for i, name, winner in candidates:
+                    count = cells[i] if i < len(cells) else u''
+                    yield [office, district, party, name, winner, label,
+                        count]
+        else:
+            office = district = party = candidates = None
+            for prefix, office_name in PRIMARY_2000_OFFICES:
+                if label.startswith(prefix):
+                    office = office_name
+                    district = u''
+                    if office_name == 'U.S. Congress':
+                        match = re.search(r'\d+', label[len(prefix):])
+                        district = match and match.group() or u''
+                    party = u'DEM' if 'Democratic' in label else u'REP'
+                    break
+
+
 class LoadResults(BaseLoader):
 
+    loader_version = 6
+
+    def __init__(self):
+        super(LoadResults, self).__init__()
+        self.datasource = Datasource()
+        self.run_context = RunContext(self.datasource)
+        self.counties = county_lookup(self.datasource.jurisdiction_mappings())
+        self.spec_2002 = results_2002_spec(self.counties)
+        self.spec_2000_primary = primary_2000_spec(self.counties)
+
     def run(self, mapping):
         self.source = mapping['generated_filename']
 
         self.timestamp = datetime.datetime.now()
-        self.datasource = Datasource()
         self.election_id = mapping['election']
         # Unlike Results, Contest and Candidate metadata is not deleted and reloaded each
         # time, since this metadata is required for multiple file types.
-        # We build lookups for this data to optimize Results data loading.
-        self.contest_lkup = self._build_lkup(Contest)
-        self.cand_lkup = self._build_lkup(Candidate)
+        # The run context tracks what's been upserted for the whole run, so each
+        # Contest and Candidate is only written once.
+        self.context = ElectionContext.build(self.election_id, self.source,
+            self.state, self.run_context.election(self.election_id),
+            target_offices=TARGET_OFFICES, timestamp=self.timestamp)
 
         print("LOAD: %s" % self.source)
         # Reload results fresh every time
-        result_count = Result.objects.filter(source=self.source).count()
-        if result_count > 0:
-            print("\tDeleting %s previously loaded results" % result_count)
-            Result.objects.filter(source=self.source).delete()
+        self.clear_results(self.source)
 
         # Load results based on file type
         if '2002' in self.election_id:
-            self.load_2002_file(mapping)
+            row_count = self.load_2002_file(mapping)
         # special case for 2000 primary
         elif '2000' in self.election_id and 'primary' in self.election_id:
-            self.load_2000_primary_file(mapping)
+            row_count = self.load_2000_primary_file(mapping)
         else:
-            self.load_non2002_file(mapping)
+            row_count = self.load_non2002_file(mapping)
+        self.record_load(mapping, row_count)
 
     # Private methods
-    def _build_lkup(self, doc_klass):
-        """Build lkup for Contests/Candiates
-
-        self_build_lkup(Candidate, mapping['generated_filename'])
-
-        """
-        # Fetch all contests or candidates for given election
-        lkup = {}
-        objs = doc_klass.objects.filter(election_id = self.election_id)
-        for obj in objs:
-            lkup[obj.key] = obj
-        return lkup
-
     @property
     def _file_handle(self):
         return open(join(self.cache.abspath, self.source), 'rU')
 
     def _get_or_create_contest(self, row, mapping):
-        year = int(re.search(r'\d{4}', self.election_id).group())
-        elecs = self.datasource.elections(year)[year]
-        # Get election metadata by matching on election slug
-        elec_meta = [e for e in elecs if e['slug'] == self.election_id][0]
-        party = row['Party'].strip()
-        slug = self._build_contest_slug(row)
-        key = (self.election_id, slug)
-        try:
-            contest = self.contest_lkup[key]
-        except KeyError:
-            kwargs = {
-                'created':  self.timestamp,
-                'updated': self.timestamp,
-                'source': self.source,
-                'election_id': self.election_id,
-                'slug': slug,
-                'state': self.state.upper(),
-                'start_date': datetime.datetime.strptime(elec_meta['start_date'], "%Y-%m-%d"),
-                'end_date': datetime.datetime.strptime(elec_meta['end_date'], "%Y-%m-%d"),
-                'election_type': elec_meta['race_type'],
-                'result_type': elec_meta['result_type'],
-                'special': elec_meta['special'],
-                'raw_office': row['Office Name'].strip(),
-                'raw_district': row['Office District'].strip(),
-            }
-            contest = Contest(**kwargs)
-            # Add party if it's a primary
-            if 'primary' in self.election_id:
-                kwargs['raw_party'] = party
-            contest.save()
-            self.contest_lkup[key] = contest
-        return contest
+        return self.get_or_create_contest(self.context,
+            row['Office Name'].strip(), row['Office District'].strip(),
+            row['Party'].strip())
 
     def _get_or_create_candidate(self, row, contest):
-        raw_full_name = row['Candidate Name'].strip()
-        slug = slugify(raw_full_name, substitute='-')
-        key = (self.election_id, contest.slug, slug)
-        try:
-            candidate = self.cand_lkup[key]
-        except KeyError:
-            cand_kwargs = {
-                'source': self.source,
-                'election_id': self.election_id,
-                'contest': contest,
-                'contest_slug': contest.slug,
-                'state': self.state.upper(),
-                'raw_full_name': raw_full_name,
-                'slug': slug,
-            }
-            candidate = Candidate.objects.create(**cand_kwargs)
-            candidate.save()
-            self.cand_lkup[key] = candidate
-        return candidate
-
-    def _build_contest_slug(self, row):
-        office = row['Office Name'].strip()
-        bits = [office]
-        district = row['Office District'].strip()
-        if district and 'pres' not in office.lower():
-            bits.append(district)
-        if 'primary' in self.source:
-            bits.append(row['Party'].lower())
-        return slugify(" ".join(bits), substitute='-')
+        return self.get_or_create_candidate(self.context, contest,
+            row['Candidate Name'].strip())
 
     def load_non2002_file(self, mapping):
+        if 'state_legislative' not in self.source:
+            if 'precinct' in self.source:
+                spec = PRECINCT_SPEC
+            else:
+                spec = COUNTY_SPEC
+            return self.load_tabular(mapping, spec, self.context)
+
+        # State legislative files have a column of results per district
         with self._file_handle as csvfile:
-            results = []
-            target_offices = set([
-                'President - Vice Pres',
-                'U.S. Senator',
-                'U.S. Congress',
-                'Governor / Lt. Governor',
-                'Comptroller',
-                'Attorney General',
-                'State Senator',
-                'House of Delegates'
-            ])
+            results = self.bulk_inserter(Result)
+            target_offices = self.context.target_offices
             reader = unicodecsv.DictReader(csvfile, encoding='latin-1')
-            for row in reader:
+            for row in self.timed_rows(reader):
                 # Skip non-target offices
                 if not row['Office Name'].strip() in target_offices:
                     continue
-                elif 'state_legislative' in self.source:
-                    results.extend(self._prep_non2002_state_leg_results(row, mapping))
-                elif 'precinct' in self.source:
-                    results.append(self._prep_non2002_precinct_result(row, mapping))
-                else:
-                    results.append(self._prep_non2002_county_result(row, mapping))
-            Result.objects.insert(results)
+                results.extend(self._prep_non2002_state_leg_results(row, mapping))
+            results.flush()
+        self.flush_candidate_parties()
+        return results.count
 
     def _result_kwargs_non2002(self, row, mapping):
         contest = self._get_or_create_contest(row, mapping)
         candidate = self._get_or_create_candidate(row, contest)
         kwargs = {
-            'source': self.source,
-            'election_id': self.election_id,
-            'state': self.state.upper(),
+            'source': self.context.source,
+            'election_id': self.context.election_id,
+            'state': self.context.state,
             'contest': contest,
             'contest_slug': contest.slug,
             'candidate': candidate,
@@ -167,11 +306,11 @@ class LoadResults(BaseLoader):
         kwargs = self._result_kwargs_non2002(row, mapping)
         kwargs.update({
             'reporting_level': 'state_legislative',
-            'raw_winner': self._non2002_winner(row), # at the contest-level
+            'raw_winner': row['Winner'].strip(), # at the contest-level
             'write_in': self._non2002_writein(row),
         })
         try:
-            kwargs['raw_write_in'] = row['Write-In?'].strip(), # at the contest-level
+            kwargs['raw_write_in'] = row['Write-In?'].strip() # at the contest-level
         except KeyError as e:
             pass
         self._update_non2002_candidate_parties(row, kwargs['candidate'])
@@ -187,68 +326,11 @@ class LoadResults(BaseLoader):
                 'raw_jurisdiction': field,
                 'raw_total_votes': self._non2002_total_votes(val),
             })
-            results.append(Result(**kwargs))
+            results.append(dict(kwargs))
         return results
 
-    def _prep_non2002_county_result(self, row, mapping):
-        kwargs = self._result_kwargs_non2002(row, mapping)
-        vote_brkdwon_fields = [
-           ('election_night_total', 'Election Night Votes'),
-           ('absentee_total', 'Absentees Votes'),
-           ('provisional_total', 'Provisional Votes'),
-           ('second_absentee_total', '2nd Absentees Votes'),
-        ]
-        vote_breakdowns = {}
-        for field, key in vote_brkdwon_fields:
-            try:
-                vote_breakdowns[field] = row[key].strip()
-            except KeyError:
-                pass
-        kwargs.update({
-            'ocd_id': mapping['ocd_id'],
-            'reporting_level': 'county',
-            'jurisdiction': mapping['name'],
-            'party': row['Party'].strip(),
-            'raw_total_votes': self._non2002_total_votes(row['Total Votes']),
-            'raw_winner': self._non2002_winner(row),
-            'raw_write_in': self._non2002_writein(row),
-            'raw_vote_breakdowns': vote_breakdowns,
-            #TODO: Move to transforms step?
-            #'total_votes': self._non2002_total_votes(row['Total Votes']),
-            #'winner': self._non2002_winner(row),
-            #'write_in': self._non2002_writein(row),
-        })
-        return Result(**kwargs)
-
-    def _prep_non2002_precinct_result(self, row, mapping):
-        kwargs = self._result_kwargs_non2002(row, mapping)
-        vote_breakdowns = {
-            'election_night_total': int(float(row['Election Night Votes']))
-        }
-        raw_district = str(row['Election District'])
-        raw_precinct = str(row['Election Precinct'])
-        kwargs.update({
-            #'ocd_id': mapping['ocd_id'],
-            'reporting_level': 'precinct',
-            'raw_jurisdiction':raw_precinct,
-            'jurisdiction': mapping['name'] + ' ' + raw_district  + "-" + raw_precinct,
-            'party': row['Party'].strip(),
-            'raw_total_votes': int(float(row['Election Night Votes'])),
-            'raw_winner': self._non2002_winner(row),
-            'raw_write_in': self._non2002_writein(row),
-            'raw_vote_breakdowns': vote_breakdowns,
-            #TODO: Move total votes to transform step?
-            #'total_votes': int(float(row['Election Night Votes'])),
-            #'winner': self._non2002_winner(row),
-            #'write_in': self._non2002_writein(row),
-        })
-        return Result(**kwargs)
-
     def _update_non2002_candidate_parties(self, row, candidate):
-        raw_party = row['Party'].strip()
-        if raw_party not in candidate.raw_parties:
-            candidate.raw_parties.append(raw_party)
-        candidate.save()
+        self.add_candidate_party(candidate, row['Party'].strip())
 
     def _non2002_total_votes(self, val):
         if val.strip() == '':
@@ -257,13 +339,6 @@ class LoadResults(BaseLoader):
             total_votes = int(float(val))
         return total_votes
 
-    def _non2002_winner(self, row):
-        if row['Winner'] == 'Y':
-            winner = True
-        else:
-            winner = False
-        return winner
-
     def _non2002_writein(self, row):
         # sometimes write-in field not present
         try:
@@ -275,185 +350,11 @@ class LoadResults(BaseLoader):
             write_in = None
         return write_in
 
-    def load_county_2002(self, row):
-        total_votes = int(float(row['votes']))
-        #TODO: replace above 2 lines with below
-        reporting_level = 'precinct'
-        ocd_id = mapping['ocd_id']
-        total_votes = int(float(row['votes']))
-        kwargs = {
-            #TODO: generate ocd_id
-            #'ocd_id': ocd_id,
-            #'jurisdiction': jurisdiction,
-            'reporting_level': reporting_level,
-            'raw_office': row['office'].strip(),
-            'candidate': candidate,
-            'party': row['party'].strip(),
-            'write_in': write_in,
-            'raw_total_votes': total_votes,
-            'vote_breakdowns': {}
-        }
-        return Result(**kwargs)
-
     def load_2002_file(self, mapping):
-        headers = [
-            'office',
-            'district',
-            'jurisdiction',
-            'last',
-            'middle',
-            'first',
-            'party',
-            'winner',
-            'vote_type',
-            'votes',
-            'fill2'
-        ]
-        # Store result instances for bulk loading
-        results = []
-        with self._file_handle as csvfile:
-            reader = unicodecsv.DictReader(csvfile, fieldnames = headers, delimiter='|', encoding='latin-1')
-            reporting_level = 'county'
-            #TODO: replace jurisidctions with datasource.mappings
-            #geographies = self.jurisdiction_mappings(('ocd','fips','urlname','name'))
-            geographies = self.mappings()
-            for row in reader:
-                if row['jurisdiction'].strip() == 'Baltimore City':
-                    geo_obj = [x for x in geographies if x['name'] == "Baltimore City"][0]
-                else:
-                    geo_obj = [x for x in geographies if x['name']+" County" == row['jurisdiction'].strip()][0]
-
-                # Winner
-                #TODO: make this raw_winner
-                #TODO: push this to transform step
-                raw_winner = row['winner']
-                #if row['winner'] == '1':
-                #    raw_winner = True
-                #else:
-                #    raw_winner = False
-
-                #TODO: push name parsing to transform step
-                # zz998 is for write-ins
-                if row['last'].strip() == 'zz998':
-                #    name = row['last'].strip()
-                #    #candidate = Candidate(state=self.state.upper(), family_name=name)
-                     write_in=True
-                else:
-                #    cand_name = self.combine_name_parts([row['first'], row['middle'], row['last']])
-                #    name = self.parse_name(cand_name)
-                     write_in=False
-                #    candidate = Candidate(state=self.state.upper(), given_name=name.first, additional_name=name.middle, family_name=name.last, suffix=name.suffix, name=name.full_name)
-
-                #TODO: handle below using the self._get_candidate_whatever(row)
-                #TODO: need a new function/method to handle 2002?
-                cand_kwargs = {
-                    'raw_family_name': row['last'].strip(),
-                    'raw_given_name': row['first'].strip(),
-                    'raw_additional_name': row['middle'].strip(),
-                }
-                 #TODO: add raw_party to candidate.raw_parties
-
-                result_kwargs = {
-                    #'election':
-                    #'candidate': candidate,
-                    'ocd_id': geo_obj['ocd_id'],
-                    #TODO: make this the county number from file
-                    'raw_jurisdiction': row['jurisdiction'],
-                    'jurisdiction': geo_obj['name'],
-                    'raw_office': row['office'].strip(),
-                    'raw_district': row['district'].strip(),
-                    'reporting_level': 'county',
-                    'raw_party': row['party'], # needs to be a member of a list
-                    'write_in': write_in,
-                    'raw_total_votes': row['votes'],
-                }
-                result = Result(**result_kwargs)
-        Result.objects.insert(results)
+        return self.load_tabular(mapping, self.spec_2002, self.context)
 
     def load_2000_primary_file(self, mapping):
-        candidates = {}
-        results = []
-        with self._file_handle as csvfile:
-            lines = csvfile.readlines()
-            #TODO: use Datasource.mappings instead of jurisdiction_mappings
-            #jurisdictions = self.jurisdiction_mappings(('ocd','fips','urlname','name'))
-            #jurisdictions = self.datasource.mappings()
-            for line in lines[0:377]:
-                if line.strip() == '':
-                    continue # skip blank lines
-                else: # determine if this is a row with an office
-                    #TODO: push party and office to transform step
-                    cols = line.strip().split(',')
-                    if cols[0][1:29] == 'President and Vice President':
-                        office_name = 'President - Vice Pres'
-                        if 'Democratic' in cols[0]:
-                            party = 'DEM'
-                        else:
-                            party = 'REP'
-                        continue
-                    elif cols[0][1:13] == 'U.S. Senator':
-                        office_name = 'U.S. Senator'
-                        if 'Democratic' in cols[0]:
-                            party = 'DEM'
-                        else:
-                            party = 'REP'
-                        continue
-                    elif cols[0][1:27] == 'Representative in Congress':
-                        district = int(cols[0][71:73])
-                        office_name = 'U.S. Congress ' + str(district)
-                        if 'Democratic' in cols[0]:
-                            party = 'DEM'
-                        else:
-                            party = 'REP'
-                        continue
-                    # skip offices we don't want
-                    elif cols[0][1:21] == 'Judge of the Circuit':
-                        continue
-                    elif cols[0][1:31] == 'Female Delegates and Alternate':
-                        continue
-                    elif cols[0][1:29] == 'Male Delegates and Alternate':
-                        continue
-                    elif cols[0][1:28] == 'Delegates to the Republican':
-                        continue
-                    elif cols[0] == '""':
-                        candidates = [x.replace('"','').strip() for x in cols if x.replace('"','') != '']
-                        winner_index = [i for i, j in enumerate(candidates) if 'Winner' in j][0] # index of winning candidate
-                        candidates[winner_index], raw_winner = candidates[winner].split(' Winner') # trims "Winner" from candidate name; we can save the remainder for raw_winner
-                        # handle name_parse and Uncommitted candidate
-                    else: # has to be a county result
-                        result = [x.replace('"','').strip() for x in cols if x != '']
-                        #juris = [j for j in jurisdictions if j['name'] == result[0].strip()][0]
-                        juris = [j for j in self.datasource.mappings() if j['name'] == result[0].strip()][0]
-                        cand_results = zip(candidates, result[1:])
-                        for cand, votes in cand_results:
-                            name = self.parse_name(cand)
-                            #cand_kwargs = {
-                                #'given_name': name.first,
-                                #'additional_name': name.middle,
-                                #'family_name': name.last,
-                                #'suffix': name.suffix,
-                                #'name': name.full_name
-                            #}
-                            if office_name == 'President - Vice Pres':
-                                cand_kwargs['state'] = 'US'
-                            else:
-                                cand_kwargs['state'] = self.state.upper()
-
-                            #TODO Get or create candidate
-                            candidate = Candidate(**cand_kwargs)
-                            result_kwargs = {
-                                'candidate': candidate,
-                                'ocd_id': juris['ocd'],
-                                'jurisdiction': juris['name'],
-                                #TODO: verify __init__ election_id logic works here
-                                'election_id': self.election_id,
-                                'slug': 'TODO',
-                                #'raw_office': office_name,
-                                'reporting_level': 'county',
-                                'party': party,
-                                'write_in': False,
-                                'total_votes': int(votes),
-                                'vote_breakdowns': {}
-                            }
-                            result = Result(**result_kwargs)
-                            results.append(result)
+        path = join(self.cache.abspath, self.source)
+        rows = primary_2000_rows(csv_rows(path), self.counties)
+        return self.load_tabular(mapping, self.spec_2000_primary,
+            self.context, rows=rows)
@@ -1,25 +1,43 @@
-from mongoengine import Q
-from nameparser import HumanName
+import re
 
-from openelex.base.transform import registry
+from openelex.base.names import name_cache
+from openelex.base.transform import changed_since, map_documents, registry
 from openelex.models import Candidate
 
-def parse_names_after_2002():
-    cands = Candidate.objects.filter(
-        (Q(election_id__not__contains="2000") | Q(election_id__not__contains="2002")),
-        state='MD'
-    )
-    #Loop through candidates, perform name parse and update
-    for cand in cands:
-        # Skip Other write-ins
-        if 'other' in cand.slug:
-            continue
-        name = HumanName(cand.raw_full_name)
-        cand.given_name = name.first
-        cand.family_name = name.last
-        cand.additional_name = name.middle
-        cand.suffix = name.suffix
-        cand.save()
+# Election ids of the 2000 and 2002 elections, whose files give candidate
+# names already split into parts
+PRE_2003_ELECTION_ID = re.compile(r'^md-200[02]-')
+
+def parse_names_after_2002(batch_size=1000, since=None, workers=None):
+    """Parse raw_full_name into name parts for candidates from 2003 on
+
+    Only candidates loaded since since are parsed, if provided, and only
+    their ids, raw names and slugs are read. Names are parsed through the
+    shared name cache, across worker processes, and parts are written
+    back in unordered bulk updates of batch_size candidates. Newly parsed
+    names are stored after each batch.
+    """
+    query = {'state': 'MD', 'election_id': {'$not': PRE_2003_ELECTION_ID}}
+    query.update(changed_since(Candidate, since))
+    map_documents(Candidate, _parse_name, query,
+        fields=['raw_full_name', 'slug'], workers=workers,
+        batch_size=batch_size, prepare=_prefetch_names,
+        finish=_flush_names)
+
+def _raw_name(cand):
+    return cand.get('raw_full_name') or u''
+
+def _prefetch_names(cands):
+    name_cache.prefetch([_raw_name(cand) for cand in cands])
+
+def _flush_names():
+    name_cache.flush()
+
+def _parse_name(cand):
+    # Skip Other write-ins
+    if 'other' in cand['slug']:
+        return None
+    return {'$set': name_cache.parse(_raw_name(cand))}
 
 #def standardize_office_and_district():
 #    pass
@@ -27,6 +45,10 @@ def parse_names_after_2002():
 #def clean_vote_counts():
     #pass
 
-registry.register('md', parse_names_after_2002)
+registry.register('md', parse_names_after_2002,
+    inputs=['candidate.raw_full_name', 'parsedname'],
+    outputs=['candidate.given_name', 'candidate.family_name',
+        'candidate.additional_name', 'candidate.suffix', 'parsedname'],
+    incremental=True)
 #registry.register('md', standardize_office_and_district)
 #registry.register('md', clean_vote_counts)
@@ -0,0 +1,179 @@
+"""
+Load West Virginia results converted to the normalized CSV format
+described in process.md:
+
+    year,election,office,district,party,candidate,county,votes,winner
+
+Each candidate has a row per county followed by a "Totals" row, which
+holds the statewide (or district-wide) total and the winner flag.
+
+Only results published as PDFs are loaded, from CSVs converted from them
+and saved in the cache alongside them. The CSVs published by the SOS from
+2008 on have a different layout, and are skipped.
+
+"""
+from itertools import chain
+from os.path import exists, join, splitext
+import datetime
+
+from openelex.base.load import BaseLoader, ElectionContext, RunContext
+from openelex.base.tabular import Column, TabularSpec, csv_rows, to_int
+from openelex.models import Result
+
+from .datasource import Datasource
+
+
+TOTALS = u'Totals'
+
+NORMALIZED_COLUMNS = (u'office', u'district', u'party', u'candidate',
+    u'county', u'votes', u'winner')
+
+
+def results_spec(county_ocd_ids):
+    """Layout of normalized results files
+
+    county_ocd_ids maps lowercase county names to OCD ids.
+    """
+    def ocd_id(row, mapping):
+        return county_ocd_ids.get(row['county'].strip().lower())
+
+    return TabularSpec(
+        office=Column('office'),
+        district=Column('district'),
+        party=Column('party'),
+        candidate=Column('candidate'),
+        votes=Column('votes', to_int),
+        result_fields={
+            'raw_jurisdiction': Column('county', lambda val: val),
+            'jurisdiction': Column('county'),
+            'ocd_id': ocd_id,
+            'raw_winner': Column('winner'),
+        },
+        reporting_level='county',
+    )
+
+
+class LoadResults(BaseLoader):
+
+    def __init__(self):
+        super(LoadResults, self).__init__()
+        self.datasource = Datasource()
+        self.run_context = RunContext(self.datasource)
+        self.spec = results_spec(dict(
+            (row['county'].lower(), row['ocd_id'])
+            for row in self.datasource.jurisdiction_mappings()
+            if row['county']))
+        # (source, contest slug, candidate slug, county sum, total) for
+        # every candidate whose county results don't add up to their
+        # Totals row
+        self.mismatches = []
+
+    def run(self, mapping):
+        self.source = mapping['generated_filename']
+        if splitext(self.source)[1].lower() != '.pdf':
+            print("SKIP (not a PDF converted to normalized CSV): %s"
+                % self.source)
+            return
+        path = self.source_path(mapping)
+        if not exists(path):
+            print("SKIP (no normalized CSV): %s" % self.source)
+            return
+        rows = csv_rows(path)
+        header = next(rows, None)
+        if header is None or (set(NORMALIZED_COLUMNS) -
+                set(val.strip() for val in header)):
+            print("SKIP (not a normalized CSV): %s" % path)
+            return
+
+        self.timestamp = datetime.datetime.now()
+        self.election_id = mapping['election']
+        self.context = ElectionContext.build(self.election_id, self.source,
+            self.state, self.run_context.election(self.election_id),
+            timestamp=self.timestamp)
+
+        print("LOAD: %s" % self.source)
+        # Reload results fresh every time
+        self.clear_results(self.source)
+
+        row_count = self.load_normalized_file(mapping, chain([header], rows))
+        self.record_load(mapping, row_count)
+
+    def source_path(self, mapping):
+        """Normalized CSV converted from a mapping's PDF, which has the
+        same name apart from its extension"""
+        return join(self.cache.abspath,
+            splitext(mapping['generated_filename'])[0] + '.csv')
+
+    def load_normalized_file(self, mapping, rows):
+        """Load county Results from rows of a normalized file
+
+        Rows are grouped by contest in a single pass. Once a contest's
+        rows have all been read, each candidate's county votes are checked
+        against their Totals row and the Totals winner flag is copied to
+        their county Results. Totals rows themselves aren't stored, since
+        they can be recomputed from the county Results.
+
+        Returns the number of Results loaded.
+        """
+        ctx = self.context
+        rows = iter(self.timed_rows(rows))
+        transform = self.spec.compile(next(rows), mapping)
+        results = self.bulk_inserter(Result)
+        contest = None
+        candidates = []
+        for values in rows:
+            record = transform(values)
+            if record is None:
+                continue
+            party, contest_kwargs, candidate_kwargs, result_kwargs = record
+            row_contest = self.get_or_create_contest(ctx, party=party,
+                **contest_kwargs)
+            if contest is None or row_contest.slug != contest.slug:
+                self._flush_contest(candidates, results)
+                contest = row_contest
+                candidates = []
+            candidate = self.get_or_create_candidate(ctx, contest,
+                **candidate_kwargs)
+            if not candidates or candidates[-1]['candidate'] is not candidate:
+                self.add_candidate_party(candidate, party)
+                candidates.append({
+                    'candidate': candidate,
+                    'results': [],
+                    'totals': None,
+                })
+            group = candidates[-1]
+            if result_kwargs['jurisdiction'] == TOTALS:
+                group['totals'] = result_kwargs
+                continue
+            result_kwargs.update({
+                'source': ctx.source,
+                'election_id': ctx.election_id,
+                'state': ctx.state,
+                'contest': contest,
+                'contest_slug': contest.slug,
+                'candidate': candidate,
+                'candidate_slug': candidate.slug,
+            })
+            group['results'].append(result_kwargs)
+        self._flush_contest(candidates, results)
+        results.flush()
+        self.flush_candidate_parties()
+        return results.count
+
+    def _flush_contest(self, candidates, results):
+        for group in candidates:
+            totals = group['totals']
+            if totals is not None:
+                county_sum = sum(kwargs['raw_total_votes']
+                    for kwargs in group['results'])
+                if county_sum != totals['raw_total_votes']:
+                    candidate = group['candidate']
+                    print("\tTotals mismatch: %s %s (counties %s, totals %s)"
+                        % (candidate.contest_slug, candidate.slug, county_sum,
+                        totals['raw_total_votes']))
+                    self.mismatches.append((self.source,
+                        candidate.contest_slug, candidate.slug, county_sum,
+                        totals['raw_total_votes']))
+                for kwargs in group['results']:
+                    kwargs['raw_winner'] = totals['raw_winner']
+            results.extend(group['results'])